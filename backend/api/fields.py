@@ -0,0 +1,78 @@
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+DECODE_CHUNK_SIZE = 64 * 1024
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    '''Изображение в base64 (data URI).
+
+    Строка декодируется по частям во временный файл. Размер проверяется
+    до декодирования, а число пикселей - по заголовку изображения, без
+    полной распаковки.
+    '''
+
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть строкой в base64.',
+        'too_large': 'Размер изображения превышает {max_bytes} байт.',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей.',
+        'invalid_format': 'Допустимые форматы: {formats}.',
+    }
+
+    def to_internal_value(self, data):
+        if data in ('', None):
+            return None
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        if data.startswith('data:'):
+            _, _, data = data.partition(';base64,')
+        # Клиенты могут переносить строки base64, как делает MIME.
+        data = ''.join(data.split())
+        max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+        if len(data) // 4 * 3 > max_bytes:
+            self.fail('too_large', max_bytes=max_bytes)
+
+        file = TemporaryUploadedFile(
+            'upload', 'application/octet-stream', 0, None)
+        try:
+            self.decode_to_file(data, file)
+            file.seek(0)
+            extension = self.inspect_image(file)
+        except Exception:
+            file.close()
+            raise
+        file.name = f'{uuid.uuid4()}.{extension}'
+        file.seek(0)
+        return super().to_internal_value(file)
+
+    def decode_to_file(self, data, file):
+        step = DECODE_CHUNK_SIZE * 4
+        for start in range(0, len(data), step):
+            try:
+                file.write(base64.b64decode(
+                    data[start:start + step], validate=True))
+            except (binascii.Error, ValueError):
+                self.fail('invalid_base64')
+        file.size = file.tell()
+
+    def inspect_image(self, file):
+        '''Читает только заголовок: формат и размеры изображения.'''
+        try:
+            with Image.open(file) as image:
+                image_format = image.format
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        if image_format not in ALLOWED_FORMATS:
+            self.fail('invalid_format', formats=', '.join(ALLOWED_FORMATS))
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        return image_format.lower().replace('jpeg', 'jpg')
@@ -1,37 +1,95 @@
-from django_filters import AllValuesMultipleFilter, FilterSet, NumberFilter
+from django.db.models import Count, Exists, OuterRef
+from django_filters import (CharFilter, ChoiceFilter, FilterSet,
+                            MultipleChoiceFilter, NumberFilter)
 
-from recipes.models import Recipe
+from recipes.cache import get_tag_ids_by_slug
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from recipes.search import search_recipes
+
+TAGS_MODES = (('any', 'any'), ('all', 'all'))
+ORDERINGS = {
+    'popular': ('-favorites_count', '-id'),
+    'trending': ('-trending_score__score', '-id'),
+    'quick': ('cooking_time', '-id'),
+}
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_ids_by_slug()]
 
 
 class RecipeFilter(FilterSet):
     is_favorited = NumberFilter(method='in_favorited')
     is_in_shopping_cart = NumberFilter(method='in_shopping_cart')
     author = NumberFilter(field_name='author_id')
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='filter_tags',
+    )
+    tags_mode = ChoiceFilter(choices=TAGS_MODES, method='skip')
+    search = CharFilter(method='full_text_search')
+    ordering = ChoiceFilter(
+        choices=[(name, name) for name in ORDERINGS],
+        method='order_recipes',
+    )
 
     class Meta:
         model = Recipe
         fields = (
             'author',
             'tags',
+            'tags_mode',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
+            'ordering',
         )
 
-    def in_favorited(self, queryset, name, value):
+    def filter_marked(self, queryset, model, value):
+        '''Рецепты, отмеченные (value=1) или не отмеченные (value=0)
+        пользователем запроса. Отметки выбираются подзапросом, а не списком
+        id, чтобы размер SQL не зависел от их числа.'''
         if value not in (1, 0):
             return queryset.none()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        marked = model.objects.filter(user=user).values('recipe_id')
         if value:
-            queryset = queryset.filter(favorited_by__user=self.request.user)
-        else:
-            queryset = queryset.exclude(favorited_by__user=self.request.user)
-        return queryset
+            return queryset.filter(pk__in=marked)
+        return queryset.exclude(pk__in=marked)
+
+    def in_favorited(self, queryset, name, value):
+        return self.filter_marked(queryset, FavoriteRecipe, value)
 
     def in_shopping_cart(self, queryset, name, value):
-        if value not in (1, 0):
-            return queryset.none()
-        if value:
-            queryset = queryset.filter(added_to_cart__user=self.request.user)
-        else:
-            queryset = queryset.exclude(added_to_cart__user=self.request.user)
+        return self.filter_marked(queryset, ShoppingCart, value)
+
+    def full_text_search(self, queryset, name, value):
+        return search_recipes(queryset, value).order_by(
+            '-search_rank', '-created')
+
+    def filter_tags(self, queryset, name, value):
+        tag_ids_by_slug = get_tag_ids_by_slug()
+        tag_ids = {tag_ids_by_slug[slug] for slug in value}
+        recipe_tags = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+        mode = self.form.cleaned_data.get('tags_mode')
+        if mode == 'all' and len(tag_ids) > 1:
+            return queryset.filter(pk__in=(
+                recipe_tags
+                .values('recipe_id')
+                .annotate(matched=Count('tag_id'))
+                .filter(matched=len(tag_ids))
+                .values('recipe_id')
+            ))
+        return queryset.filter(Exists(
+            recipe_tags.filter(recipe_id=OuterRef('pk'))))
+
+    def skip(self, queryset, name, value):
+        '''Параметр учитывается другим фильтром.'''
         return queryset
+
+    def order_recipes(self, queryset, name, value):
+        if value == 'trending':
+            queryset = queryset.filter(trending_score__isnull=False)
+        return queryset.order_by(*ORDERINGS[value])
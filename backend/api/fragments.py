@@ -0,0 +1,62 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from recipes.cache import ingredients_cache, tags_cache
+from recipes.models import IngredientRecipe
+
+
+def get_fragment_keys(request, recipes):
+    '''Ключи кэша для рецептов: id, время изменения и версии справочников.
+
+    Ссылки на изображения абсолютные, поэтому в ключ входит и адрес сайта.
+    '''
+    prefix = (
+        f'{tags_cache.get_version()}:{ingredients_cache.get_version()}:'
+        f'{request.build_absolute_uri("/") if request else ""}'
+    )
+    return {
+        recipe.pk: 'recipe_fragment:{}:{}'.format(
+            recipe.pk,
+            hashlib.md5(
+                f'{prefix}:{recipe.updated.isoformat()}'.encode()
+            ).hexdigest(),
+        )
+        for recipe in recipes
+    }
+
+
+def get_recipe_fragments(serializer, recipes):
+    '''Части представления рецептов, не зависящие от пользователя.
+
+    Готовые части берутся из кэша одним запросом. Для остальных рецептов
+    теги, ингредиенты и автор загружаются пачкой, а результат
+    serializer.build_fragment сохраняется в кэш.
+    '''
+    keys = get_fragment_keys(serializer.context.get('request'), recipes)
+    cached = cache.get_many(keys.values())
+    fragments = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+    if not missing:
+        return fragments
+    prefetch_related_objects(
+        missing,
+        'author',
+        'tags',
+        Prefetch(
+            'ingredientrecipe_set',
+            queryset=IngredientRecipe.objects.select_related('ingredient'),
+        ),
+    )
+    built = {recipe.pk: serializer.build_fragment(recipe)
+             for recipe in missing}
+    cache.set_many(
+        {keys[pk]: fragment for pk, fragment in built.items()},
+        settings.RECIPE_FRAGMENT_CACHE_TIMEOUT,
+    )
+    fragments.update(built)
+    return fragments
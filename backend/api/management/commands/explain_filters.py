@@ -0,0 +1,110 @@
+import re
+from itertools import combinations, product
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+
+from api.filters import ORDERINGS, RecipeFilter
+from recipes.models import Recipe, Tag
+from users.models import User
+
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'SCAN (\w+)\b(?! USING)'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для всех сочетаний фильтров ленты рецептов '
+            'и отмечает последовательные чтения таблиц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='id пользователя, от имени которого строятся запросы.',
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Печатать планы запросов целиком.',
+        )
+        parser.add_argument(
+            '--strict',
+            action='store_true',
+            help='Завершиться с ошибкой, если найдено последовательное '
+                 'чтение.',
+        )
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(pk=user_id)
+        user = User.objects.annotate(
+            favorites=Count('favorite_recipes')).order_by('-favorites').first()
+        if user is None:
+            raise CommandError('Нет пользователей: заполните базу данными.')
+        return user
+
+    def get_filter_values(self, user):
+        author = Recipe.objects.values_list('author_id', flat=True).first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        return {
+            'author': [str(author or user.pk)],
+            'tags': [tags] if tags else [],
+            'is_favorited': ['1', '0'],
+            'is_in_shopping_cart': ['1', '0'],
+            'ordering': list(ORDERINGS),
+        }
+
+    def get_combinations(self, values):
+        names = [name for name, options in values.items() if options]
+        for size in range(len(names) + 1):
+            for chosen in combinations(names, size):
+                for options in product(*(values[name] for name in chosen)):
+                    yield dict(zip(chosen, options))
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'СУБД {connection.vendor} не поддерживается.')
+        user = self.get_user(options['user'])
+        request = SimpleNamespace(user=user)
+        flagged = 0
+        for params in self.get_combinations(self.get_filter_values(user)):
+            data = QueryDict(mutable=True)
+            for name, value in params.items():
+                data.setlist(name, value if isinstance(value, list)
+                             else [value])
+            filterset = RecipeFilter(
+                data, queryset=Recipe.objects.all(), request=request)
+            if not filterset.is_valid():
+                raise CommandError(f'{params}: {filterset.errors}')
+            queryset = filterset.qs[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+            label = ', '.join(
+                f'{name}={value}' for name, value in params.items()
+            ) or 'без фильтров'
+            try:
+                queryset.query.sql_with_params()
+            except EmptyResultSet:
+                self.stdout.write(
+                    f'{label}: пустая выборка, запрос не выполняется')
+                continue
+            plan = queryset.explain()
+            scans = sorted(set(pattern.findall(plan)))
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(
+                    f'{label}: последовательное чтение {", ".join(scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{label}: OK'))
+            if options['verbose_plans']:
+                self.stdout.write(plan)
+        if flagged and options['strict']:
+            raise CommandError(
+                f'Последовательное чтение в {flagged} сочетаниях фильтров.')
@@ -0,0 +1,217 @@
+import json
+import re
+import resource
+import statistics
+import time
+
+import requests
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.querybudget import count_queries
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+PERCENTILES = (50, 95, 99)
+
+
+class LocalDriver:
+    '''Запросы через тестовый клиент Django в том же процессе.'''
+
+    def __init__(self, user):
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def request(self, method, path, data=None):
+        with count_queries() as counter:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(
+                path, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, counter.count
+
+    def rss(self):
+        # ru_maxrss в Linux указан в килобайтах.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class HTTPDriver:
+    '''Запросы к запущенному серверу (например, gunicorn); число запросов
+    к базе берётся из заголовка Server-Timing.'''
+
+    def __init__(self, user, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        token, _ = Token.objects.get_or_create(user=user)
+        self.session.headers['Authorization'] = f'Token {token.key}'
+
+    def request(self, method, path, data=None):
+        start = time.perf_counter()
+        response = self.session.request(
+            method.upper(), self.base_url + path, json=data)
+        elapsed = time.perf_counter() - start
+        match = SERVER_TIMING_QUERIES.search(
+            response.headers.get('Server-Timing', ''))
+        return (response.status_code, elapsed,
+                int(match.group(1)) if match else None)
+
+    def rss(self):
+        return None
+
+
+def get_scenarios(recipe_id, ingredient_prefix):
+    '''Имя сценария и список запросов, выполняемых за одну итерацию.'''
+    favorite = f'/api/recipes/{recipe_id}/favorite/'
+    cart = f'/api/recipes/{recipe_id}/shopping_cart/'
+    return {
+        'recipes_list': [('get', '/api/recipes/?limit=20', None)],
+        'recipes_filtered': [(
+            'get', '/api/recipes/?limit=20&is_favorited=0&ordering=popular',
+            None)],
+        'subscriptions': [('get', '/api/users/subscriptions/', None)],
+        'ingredients_autocomplete': [(
+            'get', f'/api/ingredients/?name={ingredient_prefix}', None)],
+        'download_shopping_cart': [
+            ('get', '/api/recipes/download_shopping_cart/', None)],
+        'favorite_toggle': [('post', favorite, None),
+                            ('delete', favorite, None)],
+        'shopping_cart_toggle': [('post', cart, None),
+                                 ('delete', cart, None)],
+    }
+
+
+def percentile(values, percent):
+    '''Перцентиль с линейной интерполяцией между соседними значениями.'''
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower)
+
+
+def summarize(latencies, queries):
+    result = {
+        f'p{percent}_ms': round(percentile(latencies, percent) * 1000, 2)
+        for percent in PERCENTILES
+    }
+    known = [count for count in queries if count is not None]
+    result['queries'] = round(statistics.mean(known), 2) if known else None
+    result['requests'] = len(latencies)
+    return result
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон основных запросов API. Печатает p50/p95/p99, '
+            'число запросов к базе и память процесса; результат можно '
+            'сохранить в JSON и сравнить с предыдущим.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--user', type=int,
+                            help='id пользователя; по умолчанию - '
+                                 'пользователь с наибольшей корзиной.')
+        parser.add_argument('--base-url',
+                            help='Адрес запущенного сервера вместо '
+                                 'тестового клиента.')
+        parser.add_argument('--scenario', action='append',
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument('--baseline',
+                            help='JSON предыдущего прогона для сравнения.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно '
+                                 'базового прогона (доля).')
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            return User.objects.get(pk=user_id)
+        user = User.objects.annotate(
+            cart=Count('cart_items')).order_by('-cart', 'pk').first()
+        if user is None:
+            raise CommandError('База пуста: запустите seed_bench.')
+        return user
+
+    def get_fixtures(self, user):
+        recipe_id = (
+            Recipe.objects
+            .exclude(favorited_by__user=user)
+            .exclude(added_to_cart__user=user)
+            .values_list('pk', flat=True)
+            .first()
+        )
+        ingredient = Ingredient.objects.order_by('pk').first()
+        if recipe_id is None or ingredient is None:
+            raise CommandError('Нет рецептов или ингредиентов для прогона.')
+        return recipe_id, ingredient.name[:3]
+
+    def run_scenario(self, driver, calls, iterations, warmup):
+        latencies, queries = [], []
+        for iteration in range(warmup + iterations):
+            for method, path, data in calls:
+                status, elapsed, count = driver.request(method, path, data)
+                if status >= 400:
+                    raise CommandError(
+                        f'{method.upper()} {path}: ответ {status}')
+                if iteration >= warmup:
+                    latencies.append(elapsed)
+                    queries.append(count)
+        return summarize(latencies, queries)
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 2:
+            raise CommandError('Нужно не меньше двух итераций.')
+        user = self.get_user(options['user'])
+        scenarios = get_scenarios(*self.get_fixtures(user))
+        for name in options['scenario'] or ():
+            if name not in scenarios:
+                raise CommandError(f'Неизвестный сценарий: {name}')
+        if options['scenario']:
+            scenarios = {name: scenarios[name]
+                         for name in options['scenario']}
+        driver = (HTTPDriver(user, options['base_url'])
+                  if options['base_url'] else LocalDriver(user))
+
+        results = {}
+        for name, calls in scenarios.items():
+            results[name] = self.run_scenario(
+                driver, calls, options['iterations'], options['warmup'])
+            self.stdout.write(f'{name}: {results[name]}')
+        report = {'user': user.pk, 'rss_bytes': driver.rss(),
+                  'scenarios': results}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def compare(self, results, baseline_path, tolerance):
+        with open(baseline_path, encoding='utf8') as file:
+            baseline = json.load(file)['scenarios']
+        regressions = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {previous["p95_ms"]} -> '
+                    f'{current["p95_ms"]} мс')
+            if (current['queries'] is not None
+                    and previous['queries'] is not None
+                    and current['queries'] > previous['queries']):
+                regressions.append(
+                    f'{name}: запросов {previous["queries"]} -> '
+                    f'{current["queries"]}')
+        if regressions:
+            raise CommandError(
+                'Ухудшение относительно базового прогона:\n'
+                + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            'Не хуже базового прогона.'))
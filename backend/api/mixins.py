@@ -1,7 +1,153 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag, urlencode
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
 
+def get_params_key(request, names=None):
+    '''Параметры запроса в каноническом порядке.
+
+    Если передан names, в ключ попадают только эти параметры без
+    пробелов по краям, чтобы посторонние параметры не плодили записи кэша.
+    '''
+    params = request.query_params.lists()
+    if names is not None:
+        params = (
+            (name, [value.strip() for value in values])
+            for name, values in params if name in names
+        )
+    return urlencode(sorted(params), doseq=True)
+
+
 class RetrieveListViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
 
     pass
+
+
+class CachedRetrieveListViewSet(RetrieveListViewSet):
+    '''Справочник, ответы которого берутся из CatalogueCache.
+
+    ETag зависит от версии справочника, поэтому повторный запрос
+    получает 304 без обращения к базе.
+    '''
+
+    catalogue_cache = None
+    # Параметры запроса, от которых зависит ответ list.
+    cache_params = ()
+
+    def cached_response(self, request, key, get_data):
+        version = self.catalogue_cache.get_version()
+        etag = quote_etag(hashlib.md5(
+            f'{self.catalogue_cache.name}:{version}:{key}'.encode()
+        ).hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        data = self.catalogue_cache.get_or_set(key, get_data, version)
+        return Response(data, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        get_list = super().list
+        return self.cached_response(
+            request,
+            f'list:{get_params_key(request, self.cache_params)}',
+            lambda: get_list(request, *args, **kwargs).data,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        get_object = super().retrieve
+        return self.cached_response(
+            request,
+            f'detail:{kwargs[self.lookup_field]}',
+            lambda: get_object(request, *args, **kwargs).data,
+        )
+
+
+class ConditionalResponseMixin:
+    '''ETag и кэш ответов list/retrieve для анонимов.
+
+    ETag строится по объектам, попавшим в ответ (см. get_fingerprint), и
+    служебным полям пагинации, поэтому меняется и при изменении счётчиков,
+    и при удалении объектов. Объекты страницы загружаются как обычно, но
+    при совпадении ETag ответ 304 отдаётся без сериализации. При
+    RECIPE_RESPONSE_CACHE_TIMEOUT готовые данные ответа хранятся в кэше
+    под ключом из ETag. Ответы авторизованным пользователям зависят от
+    пользователя и помечаются как private.
+    '''
+
+    response_cache_prefix = None
+
+    def get_fingerprint(self, objects):
+        '''Строка, меняющаяся при любом изменении данных objects.'''
+        raise NotImplementedError
+
+    def conditional_response(self, request, key, fingerprint, get_data):
+        etag = quote_etag(hashlib.md5(
+            f'{self.response_cache_prefix}:{key}:{fingerprint}'.encode()
+        ).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            timeout = settings.RECIPE_RESPONSE_CACHE_TIMEOUT
+            if timeout:
+                data = cache.get_or_set(
+                    f'response:{self.response_cache_prefix}:{etag}',
+                    get_data, timeout)
+            else:
+                data = get_data()
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = list(queryset) if page is None else page
+        fingerprint = self.get_fingerprint(objects)
+        if page is not None:
+            links = self.paginator.get_paginated_response([]).data
+            fingerprint += ':' + repr(sorted(
+                (name, value) for name, value in links.items()
+                if name != 'results'))
+
+        def get_data():
+            data = self.get_serializer(objects, many=True).data
+            if page is None:
+                return data
+            return self.get_paginated_response(data).data
+
+        return self.conditional_response(
+            request, f'list:{get_params_key(request)}', fingerprint,
+            get_data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        instance = self.get_object()
+        return self.conditional_response(
+            request,
+            f'detail:{instance.pk}',
+            self.get_fingerprint([instance]),
+            lambda: self.get_serializer(instance).data,
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if self.action in ('list', 'retrieve') and response.status_code in (
+                200, 304):
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(
+                    response, public=True,
+                    max_age=settings.RECIPE_PUBLIC_MAX_AGE)
+            patch_vary_headers(response, ('Authorization',))
+        return response
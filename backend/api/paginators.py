@@ -1,10 +1,103 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+ESTIMATE_THRESHOLD = 10000
+
+
+class UncountedPage(Page):
+    def __init__(self, object_list, number, paginator, has_more):
+        super().__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        return self.has_more
+
+
+class UncountedPaginator(Paginator):
+    '''Пагинатор без COUNT(*): наличие следующей страницы определяется
+    выборкой одной лишней строки.'''
+
+    count = None
+    num_pages = 1
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет результатов')
+        has_more = len(rows) > self.per_page
+        self.num_pages = number + 1 if has_more else number
+        return UncountedPage(rows[:self.per_page], number, self, has_more)
+
+
+class EstimatedCountPaginator(Paginator):
+    '''Для нефильтрованных выборок в PostgreSQL берёт оценку числа строк
+    из статистики планировщика, если таблица достаточно велика.'''
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if (connection.vendor == 'postgresql'
+                and not queryset.query.where
+                and not queryset.query.distinct):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    (queryset.model._meta.db_table,),
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_THRESHOLD:
+                return row[0]
+        return super().count
 
 
 class CustomPagination(PageNumberPagination):
+    '''Постраничная пагинация.
+
+    Параметр count=none отключает подсчёт общего числа объектов,
+    count=estimate разрешает оценку вместо точного COUNT(*).
+    '''
+
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    count_paginators = {
+        'none': UncountedPaginator,
+        'estimate': EstimatedCountPaginator,
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = self.count_paginators.get(
+            request.query_params.get(self.count_query_param), Paginator)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(CursorPagination):
+    ordering = ('-created', '-id')
+    page_size_query_param = 'limit'
+
+
+class FeedCursorPagination(CursorPagination):
+    '''Курсор по записям ленты подписок, идущий по их индексу.'''
+
+    ordering = ('-created', '-id')
     page_size_query_param = 'limit'
 
 
 class RecipesLimitPagination(PageNumberPagination):
+    page_size = 3
     page_size_query_param = 'recipes_limit'
     page_query_param = None
@@ -0,0 +1,135 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDERS = re.compile(r'\((?:%s|\?)(?:,\s*(?:%s|\?))*\)')
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+class QueryCounter:
+    '''Обёртка execute_wrapper: считает запросы, время и их формы.
+
+    Формой считается текст SQL без параметров, в котором списки
+    плейсхолдеров IN (...) схлопнуты, поэтому одинаковые запросы к разным
+    объектам (признак N+1) дают одну и ту же форму.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[PLACEHOLDERS.sub('(...)', sql)] += 1
+
+    def repeated(self, threshold):
+        return {
+            shape: count for shape, count in self.shapes.items()
+            if count >= threshold
+        }
+
+
+@contextmanager
+def count_queries(using=None):
+    '''Считает запросы ко всем базам (или к базе using) внутри блока.'''
+    counter = QueryCounter()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+def check_budget(counter, budget, label, raise_errors=False):
+    '''Сверяет счётчик с бюджетом и порогом повторов одного запроса.'''
+    problems = []
+    if budget is not None and counter.count > budget:
+        problems.append(
+            f'{counter.count} запросов при бюджете {budget}')
+    for shape, count in counter.repeated(
+            settings.QUERY_BUDGET_REPEAT_THRESHOLD).items():
+        problems.append(f'{count} одинаковых запросов (N+1): {shape}')
+    if not problems:
+        return
+    message = f'{label}: ' + '; '.join(problems)
+    if raise_errors:
+        raise QueryBudgetExceededError(message)
+    logger.warning(message)
+
+
+@contextmanager
+def assert_query_budget(budget, label='block'):
+    '''Помощник для тестов: падает, если блок превысил бюджет запросов.'''
+    with count_queries() as counter:
+        yield counter
+    check_budget(counter, budget, label, raise_errors=True)
+
+
+@contextmanager
+def assert_action_budget(view_class, action):
+    '''То же для действия ViewSet: бюджет берётся из атрибута
+    query_budget класса, действие без бюджета - ошибка.'''
+    label = f'{view_class.__name__}.{action}'
+    budget = getattr(view_class, 'query_budget', {}).get(action)
+    if budget is None:
+        raise AssertionError(f'{label}: бюджет не задан')
+    with assert_query_budget(budget, label) as counter:
+        yield counter
+
+
+def get_view_budget(view_func, method):
+    '''Бюджет из атрибута query_budget класса представления.
+
+    Атрибут - число или словарь {действие: число} для ViewSet.
+    '''
+    view_class = getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if not isinstance(budget, dict):
+        return budget
+    actions = getattr(view_func, 'actions', None) or {}
+    return budget.get(actions.get(method.lower()))
+
+
+class QueryBudgetMiddleware:
+    '''Считает запросы каждого ответа и добавляет заголовок Server-Timing.
+
+    Превышение бюджета представления и повторяющиеся запросы пишутся в
+    лог или, при QUERY_BUDGET_RAISE, приводят к исключению.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries() as counter:
+            response = self.get_response(request)
+        response['Server-Timing'] = (
+            f'db;dur={counter.duration * 1000:.1f};'
+            f'desc="{counter.count} queries"'
+        )
+        check_budget(
+            counter,
+            getattr(request, 'query_budget', None),
+            f'{request.method} {request.path}',
+            raise_errors=settings.QUERY_BUDGET_RAISE,
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_view_budget(view_func, request.method)
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 8192
+
+
+class ShoppingListRenderer(BaseRenderer):
+    '''Базовый рендерер списка покупок.
+
+    Строки списка отдаются по частям через stream(), render() нужен
+    только для служебных ответов (ошибки, 401 и т.п.).
+    '''
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, rows):
+        buffer = io.StringIO()
+        for part in self.iter_parts(rows):
+            buffer.write(part)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode(self.charset)
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode(self.charset)
+
+    def iter_parts(self, rows):
+        raise NotImplementedError
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def iter_parts(self, rows):
+        yield 'Корзина:\n'
+        for row in rows:
+            yield (f'{row["ingredient__name"]} - '
+                   f'{row["total_amount"]} '
+                   f'{row["ingredient__measurement_unit"]}.\n')
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def iter_parts(self, rows):
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            writer.writerow((
+                row['ingredient__name'],
+                row['ingredient__measurement_unit'],
+                row['total_amount'],
+            ))
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+        yield line.getvalue()
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def iter_parts(self, rows):
+        separator = ''
+        yield '['
+        for row in rows:
+            yield separator + json.dumps({
+                'name': row['ingredient__name'],
+                'measurement_unit': row['ingredient__measurement_unit'],
+                'amount': row['total_amount'],
+            }, ensure_ascii=False)
+            separator = ', '
+        yield ']'
@@ -1,13 +1,31 @@
+from collections import Counter
+
 from django.contrib.auth.password_validation import validate_password
-from django.db import transaction
-from drf_extra_fields.fields import Base64ImageField
+from django.db import models, transaction
 from rest_framework import serializers
 
-from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from recipes.marks import MARK_BATCH_LIMIT
+from recipes.membership import get_recipe_flags
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.services import update_recipe_in_shopping_lists
 from users.models import Following, User
 
-from .paginators import RecipesLimitPagination
+from .fields import StreamingBase64ImageField
+from .fragments import get_recipe_fragments
+
+
+def get_followed_ids(request):
+    '''id авторов, на которых подписан пользователь запроса.
+
+    Загружаются один раз за запрос, а не для каждого пользователя в списке.
+    '''
+    if not hasattr(request, '_followed_ids'):
+        user = request.user
+        request._followed_ids = set(
+            Following.objects.filter(follower=user).values_list(
+                'to_follow_id', flat=True)
+        ) if user.is_authenticated else set()
+    return request._followed_ids
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -30,11 +48,9 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return Following.objects.filter(
-                follower=user, to_follow=obj).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_followed_ids(self.context['request'])
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -93,7 +109,25 @@ class IngredientRecipeCreateSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    '''Список рецептов: части из кэша одним запросом и данные
+    пользователя поверх них.'''
+
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, models.Manager) else data)
+        fragments = get_recipe_fragments(self.child, recipes)
+        return [self.child.overlay(fragments[recipe.pk], recipe)
+                for recipe in recipes]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
+    '''Рецепт с данными, зависящими от пользователя запроса.
+
+    Остальная часть представления кэшируется (см. api.fragments), флаги,
+    подписка на автора и счётчики подставляются при каждом ответе.
+    '''
+
     author = UserSerializer(read_only=True, )
     tags = TagSerializer(many=True, )
     ingredients = IngredientRecipeSerializer(
@@ -102,7 +136,9 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField(allow_null=True, )
+    image = StreamingBase64ImageField(allow_null=True, )
+    image_thumbnail = serializers.ImageField(read_only=True)
+    image_feed = serializers.ImageField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -115,27 +151,51 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumbnail',
+            'image_feed',
             'text',
             'cooking_time',
+            'favorites_count',
+            'cart_count',
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        fragment = get_recipe_fragments(self, [instance])[instance.pk]
+        return self.overlay(fragment, instance)
+
+    def build_fragment(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
+    def overlay(self, fragment, instance):
+        request = self.context['request']
+        flags = get_recipe_flags(request)
+        data = dict(fragment)
+        data['author'] = dict(fragment['author'])
+        data['author']['is_subscribed'] = (
+            instance.is_author_subscribed
+            if hasattr(instance, 'is_author_subscribed')
+            else instance.author_id in get_followed_ids(request)
+        )
+        data['is_favorited'] = flags.is_favorited(instance.pk)
+        data['is_in_shopping_cart'] = flags.is_in_shopping_cart(instance.pk)
+        data['favorites_count'] = instance.favorites_count
+        data['cart_count'] = instance.cart_count
+        return data
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return FavoriteRecipe.objects.filter(recipe=obj,
-                                                 user=user).exists()
-        return False
+        return get_recipe_flags(self.context['request']).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_authenticated:
-            return ShoppingCart.objects.filter(recipe=obj,
-                                               user=user).exists()
-        return False
+        return get_recipe_flags(
+            self.context['request']).is_in_shopping_cart(obj.id)
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(allow_null=True, )
+    image = StreamingBase64ImageField(allow_null=True, )
+    image_thumbnail = serializers.ImageField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -143,6 +203,7 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_thumbnail',
             'cooking_time',
         )
 
@@ -157,7 +218,7 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all(),
     )
     author = UserSerializer(default=serializers.CurrentUserDefault())
-    image = Base64ImageField(allow_null=True, )
+    image = StreamingBase64ImageField(allow_null=True, )
 
     class Meta:
         model = Recipe
@@ -172,6 +233,14 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
             'author',
         )
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
         serializer = RecipeSerializer(
             instance,
@@ -202,36 +271,75 @@ class CreateUpdateRecipeSerializer(serializers.ModelSerializer):
                                 update=False):
         ingredients_data = data.pop('ingredientrecipe_set')
         tags_data = data.pop('tags')
-        if update:
-            IngredientRecipe.objects.filter(recipe=recipe).delete()
-        else:
-            recipe = Recipe.objects.create(**data)
-        ingredients_to_create = []
+        amounts = Counter()
         for ingredient in ingredients_data:
-            ingredient_id = ingredient['ingredient']['id']
-            ingredient_amount = ingredient['amount']
-            try:
-                ingredient = Ingredient.objects.get(id=ingredient_id)
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError(
-                    f'Ингридиента с id {ingredient_id} не существует')
-            ingredient_recipe = IngredientRecipe(
-                recipe=recipe,
-                ingredient=ingredient,
-                amount=ingredient_amount)
-            ingredients_to_create.append(ingredient_recipe)
+            amounts[ingredient['ingredient']['id']] += ingredient['amount']
+        ingredients = Ingredient.objects.in_bulk(amounts)
+        missing = sorted(set(amounts) - set(ingredients))
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингридиентов с id {", ".join(map(str, missing))} '
+                f'не существует')
 
-        if ingredients_to_create:
-            IngredientRecipe.objects.bulk_create(ingredients_to_create)
+        if update:
+            old_amounts = self.sync_ingredient_rows(
+                recipe, ingredients, amounts)
+            recipe.tags.set(tags_data)
+            update_recipe_in_shopping_lists(recipe.id, old_amounts, amounts)
+            return recipe
 
+        recipe = Recipe.objects.create(**data)
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient=ingredients[ingredient_id],
+                amount=amount)
+            for ingredient_id, amount in amounts.items()
+        )
         recipe.tags.set(tags_data)
-        if not update:
-            return recipe
+        return recipe
+
+    def sync_ingredient_rows(self, recipe, ingredients, amounts):
+        '''Приводит ингредиенты рецепта к amounts изменением только
+        отличающихся строк. Возвращает прежние количества.'''
+        old_amounts = Counter()
+        existing = {}
+        to_delete = []
+        for row in IngredientRecipe.objects.filter(recipe=recipe):
+            old_amounts[row.ingredient_id] += row.amount
+            if (row.ingredient_id in existing
+                    or row.ingredient_id not in amounts):
+                to_delete.append(row.pk)
+            else:
+                existing[row.ingredient_id] = row
+
+        to_create, to_update = [], []
+        for ingredient_id, amount in amounts.items():
+            row = existing.get(ingredient_id)
+            if row is None:
+                to_create.append(IngredientRecipe(
+                    recipe=recipe,
+                    ingredient=ingredients[ingredient_id],
+                    amount=amount))
+            elif row.amount != amount:
+                row.amount = amount
+                to_update.append(row)
+
+        if to_delete:
+            IngredientRecipe.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            IngredientRecipe.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            IngredientRecipe.objects.bulk_create(to_create)
+        return old_amounts
 
 
 class FollowSerializer(UserSerializer):
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes = ShortRecipeSerializer(
+        many=True,
+        read_only=True,
+        source='recent_recipes',
+    )
 
     class Meta:
         model = User
@@ -244,20 +352,9 @@ class FollowSerializer(UserSerializer):
             'is_subscribed',
             'recipes',
             'recipes_count',
+            'followers_count',
         )
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author_id=obj.id).count()
-
-    def get_recipes(self, obj):
-        paginator = RecipesLimitPagination()
-        limit = self.context['request'].query_params.get('recipes_limit', 3)
-        paginator.page_size = limit
-        queryset = obj.recipes.all()
-        page = paginator.paginate_queryset(queryset, self.context['request'])
-        serializer = ShortRecipeSerializer(page, many=True)
-        return serializer.data
-
 
 class ValidateFollowSerializer(serializers.Serializer):
     def validate(self, data):
@@ -282,26 +379,9 @@ class ValidateFollowSerializer(serializers.Serializer):
         return data
 
 
-class ShoppingCartSerializer(serializers.Serializer):
-    def validate(self, data):
-        action = self.context['action']
-        user = self.context['user']
-        recipe = self.context['recipe']
-        method = self.context['method']
-        favorited = FavoriteRecipe.objects.filter(
-            recipe=recipe, user=user).exists()
-        in_cart = ShoppingCart.objects.filter(
-            recipe=recipe, user=user).exists()
-
-        if action == 'favorite':
-            if method == 'POST' and favorited:
-                raise serializers.ValidationError('Уже в избранном')
-            if method == 'DELETE' and not favorited:
-                raise serializers.ValidationError('Отсутствует в избранном')
-
-        if action == 'shopping_cart':
-            if method == 'POST' and in_cart:
-                raise serializers.ValidationError('Уже в корзине')
-            if method == 'DELETE' and not in_cart:
-                raise serializers.ValidationError('Отсутствует в корзине')
-        return data
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MARK_BATCH_LIMIT,
+    )
@@ -0,0 +1,145 @@
+import base64
+import io
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from api.querybudget import assert_action_budget
+from api.tests import RecipeDataMixin
+from api.views import RecipeViewSet, UserViewSet
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), '#c0ffee').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class QueryBudgetTest(RecipeDataMixin, TestCase):
+    '''Каждое действие RecipeViewSet и UserViewSet укладывается в бюджет.'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def request(self, view_class, action, make_request):
+        cache.clear()
+        with assert_action_budget(view_class, action):
+            return make_request()
+
+    def recipe_payload(self, image=True):
+        payload = {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [tag.pk for tag in self.tags[:2]],
+            'ingredients': [{'id': ingredient.pk, 'amount': 5}
+                            for ingredient in self.ingredients[:4]],
+        }
+        if image:
+            payload['image'] = make_image()
+        return payload
+
+    def test_recipe_read(self):
+        paths = (
+            ('list', '/api/recipes/?limit=10'),
+            ('list', '/api/recipes/?limit=10&is_favorited=1&tags=tag1'),
+            ('list', '/api/recipes/?limit=10&ordering=popular'),
+            ('retrieve', f'/api/recipes/{self.recipes[0].pk}/'),
+        )
+        for client in (self.anonymous, self.client):
+            for action, path in paths:
+                with self.subTest(path=path, user=client is self.client):
+                    response = self.request(
+                        RecipeViewSet, action, lambda: client.get(path))
+                    self.assertEqual(response.status_code, 200)
+
+    def test_recipe_create(self):
+        client = self.make_client(self.authors[0])
+        response = self.request(RecipeViewSet, 'create', lambda: client.post(
+            '/api/recipes/', self.recipe_payload(), format='json'))
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_recipe_partial_update(self):
+        recipe = self.recipes[0]
+        client = self.make_client(recipe.author)
+        for image in (False, True):
+            with self.subTest(image=image):
+                response = self.request(
+                    RecipeViewSet, 'partial_update', lambda: client.patch(
+                        f'/api/recipes/{recipe.pk}/',
+                        self.recipe_payload(image), format='json'))
+                self.assertEqual(response.status_code, 200, response.data)
+
+    def test_recipe_destroy(self):
+        recipe = self.recipes[0]
+        client = self.make_client(recipe.author)
+        response = self.request(RecipeViewSet, 'destroy', lambda: (
+            client.delete(f'/api/recipes/{recipe.pk}/')))
+        self.assertEqual(response.status_code, 204)
+
+    def test_recipe_mark(self):
+        for action in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{self.recipes[1].pk}/{action}/'
+            with self.subTest(action=action):
+                response = self.request(
+                    RecipeViewSet, action, lambda: self.client.post(path))
+                self.assertEqual(response.status_code, 201)
+                response = self.request(
+                    RecipeViewSet, action, lambda: self.client.delete(path))
+                self.assertEqual(response.status_code, 204)
+
+    def test_recipe_mark_batch(self):
+        ids = {'recipes': [recipe.pk for recipe in self.recipes]}
+        for action, path in (
+            ('favorite_batch', '/api/recipes/favorite/'),
+            ('shopping_cart_batch', '/api/recipes/shopping_cart/'),
+        ):
+            with self.subTest(action=action):
+                response = self.request(
+                    RecipeViewSet, action,
+                    lambda: self.client.post(path, ids, format='json'))
+                self.assertEqual(response.status_code, 200)
+                response = self.request(
+                    RecipeViewSet, action,
+                    lambda: self.client.delete(path, ids, format='json'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_download_shopping_cart(self):
+        response = self.request(
+            RecipeViewSet, 'download_shopping_cart',
+            lambda: self.client.get('/api/recipes/download_shopping_cart/'))
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+
+    def test_feed(self):
+        response = self.request(RecipeViewSet, 'feed', lambda: (
+            self.client.get('/api/recipes/feed/')))
+        self.assertEqual(response.status_code, 200)
+
+    def test_subscribe(self):
+        path = f'/api/users/{self.authors[1].pk}/subscribe/'
+        response = self.request(
+            UserViewSet, 'subscribe', lambda: self.client.post(path))
+        self.assertEqual(response.status_code, 201)
+        response = self.request(
+            UserViewSet, 'subscribe', lambda: self.client.delete(path))
+        self.assertEqual(response.status_code, 204)
+
+    def test_subscriptions(self):
+        response = self.request(UserViewSet, 'subscriptions', lambda: (
+            self.client.get('/api/users/subscriptions/?recipes_limit=2')))
+        self.assertEqual(response.status_code, 200)
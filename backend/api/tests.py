@@ -0,0 +1,339 @@
+import base64
+import io
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.fields import StreamingBase64ImageField
+from recipes.cache import tags_cache
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from users.models import Following, User
+
+RECIPES = 25
+
+
+class RecipeDataMixin:
+    '''Рецепты с тегами, ингредиентами, избранным и корзиной.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass',
+            first_name='Читатель', last_name='Тестовый')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass', first_name='Автор', last_name=str(i))
+            for i in range(3)
+        ]
+        Following.objects.create(follower=cls.user, to_follow=cls.authors[0])
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(10)
+        ]
+        cls.recipes = []
+        for i in range(RECIPES):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {i}', author=cls.authors[i % 3], text='Текст',
+                cooking_time=i + 1, image='recipes/test.png')
+            recipe.tags.set(cls.tags[:i % 3 + 1])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe,
+                                 ingredient=cls.ingredients[(i + j) % 10],
+                                 amount=j + 1)
+                for j in range(3)
+            )
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = self.make_client(self.user)
+
+    def make_client(self, user):
+        '''Клиент с заголовком Authorization: Token, как у фронтенда.'''
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def count_queries(self, client, path):
+        '''Число запросов к базе для ответа на path с пустым кэшем.'''
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+
+class RecipeFlagsQueriesTest(RecipeDataMixin, TestCase):
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        queries = self.count_queries(self.client, '/api/recipes/?limit=5')
+        self.assertEqual(
+            queries, self.count_queries(self.client, '/api/recipes/?limit=20'))
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/recipes/?limit=20')
+        results = response.data['results']
+        self.assertEqual(len(results), 20)
+        favorited = {recipe.pk for recipe in self.recipes[::2]}
+        for item in results:
+            self.assertEqual(item['is_favorited'], item['id'] in favorited)
+
+
+class RecipeQueriesTest(RecipeDataMixin, TestCase):
+    LIMITS = (1, 5, 10, 25)
+
+    def assert_list_queries(self, client):
+        counts = {
+            limit: self.count_queries(client, f'/api/recipes/?limit={limit}')
+            for limit in self.LIMITS
+        }
+        self.assertEqual(len(set(counts.values())), 1, counts)
+        cache.clear()
+        with self.assertNumQueries(counts[self.LIMITS[-1]]):
+            response = client.get(f'/api/recipes/?limit={self.LIMITS[-1]}')
+        self.assertEqual(len(response.data['results']), RECIPES)
+
+    def test_anonymous_list(self):
+        self.assert_list_queries(self.anonymous)
+
+    def test_authenticated_list(self):
+        self.assert_list_queries(self.client)
+
+    def assert_detail_queries(self, client, queries):
+        for recipe in (self.recipes[0], self.recipes[-1]):
+            cache.clear()
+            with self.assertNumQueries(queries):
+                response = client.get(f'/api/recipes/{recipe.pk}/')
+            self.assertEqual(response.data['id'], recipe.pk)
+            self.assertEqual(len(response.data['ingredients']), 3)
+
+    def test_anonymous_detail(self):
+        self.assert_detail_queries(self.anonymous, 3)
+
+    def test_authenticated_detail(self):
+        self.assert_detail_queries(self.client, 5)
+        response = self.client.get(f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertTrue(response.data['author']['is_subscribed'])
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+
+
+class ShoppingCartDownloadTest(RecipeDataMixin, TestCase):
+    URL = '/api/recipes/download_shopping_cart/?format=txt'
+
+    def get_etag(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_not_modified(self):
+        etag = self.get_etag()
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_follows_amounts(self):
+        etag = self.get_etag()
+        items = list(self.user.shopping_list.order_by('ingredient_id')[:3])
+        # Изменения, сохраняющие число строк, сумму и взвешенную сумму.
+        for item, delta in zip(items, (1, -2, 1)):
+            item.total_amount += delta
+        ShoppingListItem.objects.bulk_update(items, ['total_amount'])
+        self.assertNotEqual(self.get_etag(), etag)
+
+    def test_etag_follows_measurement_units(self):
+        etag = self.get_etag()
+        ingredient = self.user.shopping_list.first().ingredient
+        ingredient.measurement_unit = 'кг'
+        ingredient.save()
+        self.assertNotEqual(self.get_etag(), etag)
+
+
+class IngredientSearchTest(RecipeDataMixin, TestCase):
+
+    def test_blank_name_returns_catalogue(self):
+        expected = Ingredient.objects.count()
+        for name in ('', '  '):
+            response = self.anonymous.get('/api/ingredients/', {'name': name})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), expected)
+
+    def test_search_by_name(self):
+        response = self.anonymous.get('/api/ingredients/', {'name': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.data],
+                         ['Ингредиент 5'])
+
+
+class RecipeTagsFilterTest(RecipeDataMixin, TestCase):
+
+    def get_ids(self, params):
+        response = self.anonymous.get('/api/recipes/', {'limit': RECIPES,
+                                                        **params})
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_tags_mode(self):
+        tags = ['tag1', 'tag2']
+        self.assertEqual(
+            self.get_ids({'tags': tags, 'tags_mode': 'all'}),
+            {recipe.pk for recipe in self.recipes[2::3]})
+        self.assertEqual(
+            self.get_ids({'tags': tags, 'tags_mode': 'any'}),
+            {recipe.pk for i, recipe in enumerate(self.recipes) if i % 3})
+        self.assertEqual(self.get_ids({'tags': tags}),
+                         self.get_ids({'tags': tags, 'tags_mode': 'any'}))
+
+    def test_invalid_tags_mode(self):
+        response = self.anonymous.get(
+            '/api/recipes/', {'tags': 'tag1', 'tags_mode': 'some'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags_mode', response.data)
+
+
+class RecipeMarksFilterTest(RecipeDataMixin, TestCase):
+
+    def get_ids(self, client, params):
+        response = client.get('/api/recipes/', {'limit': RECIPES, **params})
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_marks_filters(self):
+        favorites = {recipe.pk for recipe in self.recipes[::2]}
+        cart = {recipe.pk for recipe in self.recipes[::3]}
+        everything = {recipe.pk for recipe in self.recipes}
+        self.assertEqual(
+            self.get_ids(self.client, {'is_favorited': 1}), favorites)
+        self.assertEqual(
+            self.get_ids(self.client, {'is_favorited': 0}),
+            everything - favorites)
+        self.assertEqual(
+            self.get_ids(self.client, {'is_in_shopping_cart': 1}), cart)
+        self.assertEqual(
+            self.get_ids(self.anonymous, {'is_favorited': 1}), set())
+        self.assertEqual(
+            self.get_ids(self.anonymous, {'is_favorited': 0}), everything)
+
+    def test_filter_uses_subquery(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/recipes/', {'is_favorited': 1})
+        recipe_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'recipes_favoriterecipe' in query['sql']
+            and query['sql'].startswith('SELECT "recipes_recipe"')
+        ]
+        self.assertTrue(recipe_queries)
+        for sql in recipe_queries:
+            self.assertIn('IN (SELECT', sql)
+
+
+class RecipeConditionalResponseTest(RecipeDataMixin, TestCase):
+    LIST = '/api/recipes/?limit=5'
+
+    def get_etag(self, path):
+        response = self.anonymous.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        return response['ETag']
+
+    def test_list_not_modified_without_aggregates(self):
+        etag = self.get_etag(self.LIST)
+        with self.assertNumQueries(2):
+            response = self.anonymous.get(self.LIST, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        etag = self.get_etag(self.LIST + '&count=none')
+        with self.assertNumQueries(1):
+            response = self.anonymous.get(
+                self.LIST + '&count=none', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_follows_counters(self):
+        etag = self.get_etag(self.LIST)
+        page = self.anonymous.get(self.LIST).data['results']
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteRecipe.objects.create(
+                user=self.authors[0], recipe_id=page[-1]['id'])
+        self.assertNotEqual(self.get_etag(self.LIST), etag)
+
+    def test_list_etag_follows_deletes_off_page(self):
+        etag = self.get_etag(self.LIST)
+        self.recipes[0].delete()
+        self.assertNotEqual(self.get_etag(self.LIST), etag)
+
+    def test_detail(self):
+        path = f'/api/recipes/{self.recipes[1].pk}/'
+        etag = self.get_etag(path)
+        with self.assertNumQueries(1):
+            response = self.anonymous.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        ShoppingCart.objects.create(user=self.authors[0],
+                                    recipe=self.recipes[1])
+        self.assertNotEqual(self.get_etag(path), etag)
+        self.assertEqual(self.anonymous.get('/api/recipes/0/').status_code,
+                         404)
+
+
+class CatalogueCacheTest(RecipeDataMixin, TestCase):
+
+    def test_lost_version_does_not_revive_stale_entries(self):
+        response = self.anonymous.get('/api/tags/')
+        etag = response['ETag']
+        Tag.objects.create(name='Новый тег', color='#ffffff', slug='new')
+        cache.delete(tags_cache.version_key)
+        response = self.anonymous.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), Tag.objects.count())
+
+    def test_unknown_params_share_entry(self):
+        etag = self.anonymous.get('/api/tags/')['ETag']
+        for value in range(3):
+            response = self.anonymous.get('/api/tags/', {'junk': value})
+            self.assertEqual(response['ETag'], etag)
+        self.assertEqual(
+            self.anonymous.get('/api/ingredients/', {'junk': 1})['ETag'],
+            self.anonymous.get('/api/ingredients/')['ETag'])
+
+
+class RecipeSearchPaginationTest(RecipeDataMixin, TestCase):
+
+    def test_search_keeps_rank_order_with_cursor(self):
+        params = {'search': 'Рецепт 1', 'limit': 5}
+        expected = self.anonymous.get('/api/recipes/', params).data
+        response = self.anonymous.get(
+            '/api/recipes/', {**params, 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('count', response.data)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [item['id'] for item in expected['results']])
+
+
+class Base64ImageFieldTest(TestCase):
+
+    def test_line_wrapped_base64(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), '#c0ffee').save(buffer, 'PNG')
+        encoded = base64.encodebytes(buffer.getvalue()).decode()
+        self.assertIn('\n', encoded.strip())
+        image = StreamingBase64ImageField().to_internal_value(
+            'data:image/png;base64,' + encoded)
+        self.assertTrue(image.name.endswith('.png'))
+        image.close()
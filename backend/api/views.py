@@ -1,30 +1,69 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import hashlib
+
+from django.db.models import Exists, OuterRef, Prefetch, Subquery, Value
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
+from recipes.autocomplete import autocomplete_ingredients
+from recipes.cache import ingredients_cache, tags_cache, trending_cache
+from recipes.feed import pull_feed
+from recipes.marks import MARK_MODELS, add_marks, remove_marks
+from recipes.models import Ingredient, Recipe, Tag
 from users.models import Following, User
+
 from .filters import RecipeFilter
-from .mixins import RetrieveListViewSet
-from .paginators import CustomPagination
+from .mixins import CachedRetrieveListViewSet, ConditionalResponseMixin
+from .paginators import (CustomPagination, FeedCursorPagination,
+                         RecipeCursorPagination, RecipesLimitPagination)
 from .permissions import IsAdminOrAuthorOrReadOnly
+from .renderers import (CSVShoppingListRenderer, JSONShoppingListRenderer,
+                        TextShoppingListRenderer)
 from .serializers import (CreateUpdateRecipeSerializer, FollowSerializer,
-                          IngredientSerializer, RecipeSerializer,
-                          ShoppingCartSerializer, ShortRecipeSerializer,
+                          IngredientSerializer, RecipeIdsSerializer,
+                          RecipeSerializer, ShortRecipeSerializer,
                           TagSerializer, UserSerializer,
                           ValidateFollowSerializer)
 
+MARK_ERRORS = {
+    'favorite': ('Уже в избранном', 'Отсутствует в избранном'),
+    'shopping_cart': ('Уже в корзине', 'Отсутствует в корзине'),
+}
+
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    query_budget = {
+        'subscribe': 10,
+        'subscriptions': 5,
+    }
+
+    def get_queryset(self):
+        if self.action not in ('subscribe', 'subscriptions'):
+            return self.queryset
+        limit = RecipesLimitPagination().get_page_size(self.request)
+        recent_recipes = Recipe.objects.filter(
+            author=OuterRef('author')).values('pk')[:limit]
+        return self.queryset.annotate(
+            is_subscribed=Exists(Following.objects.filter(
+                follower=self.request.user, to_follow=OuterRef('pk'))),
+        ).order_by('id').prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.filter(
+                    pk__in=Subquery(recent_recipes)),
+                to_attr='recent_recipes',
+            ),
+        )
 
     @action(methods=['POST', 'DELETE'],
             permission_classes=(IsAuthenticated,),
@@ -36,8 +75,6 @@ class UserViewSet(viewsets.ModelViewSet):
         validate_serializer = ValidateFollowSerializer(
             data=request.data, context=context)
         validate_serializer.is_valid(raise_exception=True)
-        create_serializer = FollowSerializer(
-            follow_to, context={'request': request})
 
         if request.method == 'DELETE':
             Following.objects.get(follower=request.user,
@@ -46,6 +83,10 @@ class UserViewSet(viewsets.ModelViewSet):
 
         Following.objects.create(follower=request.user,
                                  to_follow=follow_to)
+        follow_to.is_subscribed = True
+        follow_to.followers_count += 1
+        create_serializer = FollowSerializer(
+            follow_to, context={'request': request})
         return Response(data=create_serializer.data,
                         status=status.HTTP_201_CREATED)
 
@@ -53,7 +94,7 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,),
             detail=False, )
     def subscriptions(self, request):
-        queryset = User.objects.filter(
+        queryset = self.get_queryset().filter(
             following__follower=self.request.user)
         paginator = CustomPagination()
         follows = paginator.paginate_queryset(queryset, request)
@@ -62,104 +103,219 @@ class UserViewSet(viewsets.ModelViewSet):
         return paginator.get_paginated_response(serializer.data)
 
 
-class TagViewSet(RetrieveListViewSet):
+class TagViewSet(CachedRetrieveListViewSet):
     queryset = Tag.objects.all()
+    catalogue_cache = tags_cache
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(RetrieveListViewSet):
+class IngredientViewSet(CachedRetrieveListViewSet):
     queryset = Ingredient.objects.all()
+    catalogue_cache = ingredients_cache
+    cache_params = ('name',)
     serializer_class = IngredientSerializer
-    filter_backends = (SearchFilter,)
-    search_fields = ('^name',)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name', '')
+        if not name.strip():
+            return super().list(request, *args, **kwargs)
+        return Response(autocomplete_ingredients(name))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    response_cache_prefix = 'recipes'
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     filterset_fields = ('author', 'tags')
     permission_classes = (IsAuthenticatedOrReadOnly, IsAdminOrAuthorOrReadOnly)
+    query_budget = {
+        'list': 7,
+        'retrieve': 5,
+        'create': 25,
+        'partial_update': 28,
+        'destroy': 22,
+        'favorite': 6,
+        'shopping_cart': 11,
+        'favorite_batch': 5,
+        'shopping_cart_batch': 10,
+        'download_shopping_cart': 3,
+        'feed': 8,
+    }
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            # Курсор идёт по дате создания, а ordering и search задают
+            # свой порядок, поэтому с ними остаётся постраничная пагинация.
+            if (params.get('pagination') == 'cursor'
+                    and 'ordering' not in params
+                    and not params.get('search', '').strip()):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        if self.action in MARK_MODELS:
+            return self.queryset
+        # Теги и ингредиенты загружаются только для рецептов, которых нет
+        # в кэше представлений (см. api.fragments).
+        queryset = self.queryset.select_related('author')
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(is_author_subscribed=Value(False))
+        return queryset.annotate(
+            is_author_subscribed=Exists(Following.objects.filter(
+                follower=user, to_follow=OuterRef('author'))),
+        )
+
+    def get_catalogue_versions(self):
+        return ':'.join(str(catalogue.get_version()) for catalogue in (
+            tags_cache, ingredients_cache, trending_cache))
+
+    def get_fingerprint(self, recipes):
+        digest = hashlib.md5(self.get_catalogue_versions().encode())
+        for recipe in recipes:
+            digest.update(
+                f':{recipe.pk}:{recipe.updated.isoformat()}:'
+                f'{recipe.favorites_count}:{recipe.cart_count}'.encode())
+        return digest.hexdigest()
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return CreateUpdateRecipeSerializer
         return RecipeSerializer
 
-    @action(methods=['POST', 'DELETE'],
-            detail=True,
-            permission_classes=(IsAuthenticated,))
-    def favorite(self, request, pk):
+    def mark(self, request, pk, action):
+        model = MARK_MODELS[action]
+        already_marked, not_marked = MARK_ERRORS[action]
+        if request.method == 'DELETE':
+            if remove_marks(model, request.user.id, [self.get_pk(pk)]):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            self.get_object()
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [not_marked]})
+
         recipe = self.get_object()
-        context = {
-            'action': 'favorite',
-            'user': request.user,
-            'recipe': recipe,
-            'method': request.method
-        }
-        to_validate = ShoppingCartSerializer(data=request.data,
-                                             context=context)
-        to_validate.is_valid(raise_exception=True)
+        if not add_marks(model, request.user.id, [recipe.id]):
+            raise ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [already_marked]})
         serializer = ShortRecipeSerializer(recipe)
+        return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
+    def mark_batch(self, request, action):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        model = MARK_MODELS[action]
         if request.method == 'DELETE':
-            FavoriteRecipe.objects.get(recipe=recipe,
-                                       user=request.user).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            changed = remove_marks(model, request.user.id, recipe_ids)
+            key = 'removed'
+        else:
+            changed = add_marks(model, request.user.id, recipe_ids)
+            key = 'added'
+        return Response({
+            key: changed,
+            'skipped': sorted(set(recipe_ids).difference(changed)),
+        })
 
-        FavoriteRecipe.objects.get_or_create(
-            recipe=recipe, user=request.user)
-        return Response(
-            data=serializer.data, status=status.HTTP_201_CREATED)
+    def get_pk(self, pk):
+        try:
+            return int(pk)
+        except (TypeError, ValueError):
+            raise NotFound
+
+    @action(methods=['POST', 'DELETE'],
+            detail=True,
+            permission_classes=(IsAuthenticated,))
+    def favorite(self, request, pk):
+        return self.mark(request, pk, 'favorite')
 
     @action(methods=['POST', 'DELETE'],
             detail=True,
             permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk):
-        recipe = self.get_object()
-        context = {'action': 'shopping_cart', 'user': request.user,
-                   'recipe': recipe, 'method': request.method}
-        to_validate = ShoppingCartSerializer(data=request.data,
-                                             context=context)
-        to_validate.is_valid(raise_exception=True)
-        to_create = ShortRecipeSerializer(recipe)
+        return self.mark(request, pk, 'shopping_cart')
 
-        if request.method == 'DELETE':
-            ShoppingCart.objects.get(recipe=recipe, user=request.user).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(methods=['POST', 'DELETE'],
+            detail=False,
+            url_path='favorite',
+            url_name='favorite-batch',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        return self.mark_batch(request, 'favorite')
 
-        ShoppingCart.objects.create(recipe=recipe, user=request.user)
-        return Response(
-            data=to_create.data, status=status.HTTP_201_CREATED)
+    @action(methods=['POST', 'DELETE'],
+            detail=False,
+            url_path='shopping_cart',
+            url_name='shopping-cart-batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return self.mark_batch(request, 'shopping_cart')
 
     @action(methods=['GET'],
             detail=False,
             permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        pull_feed(request.user)
+        paginator = FeedCursorPagination()
+        items = paginator.paginate_queryset(
+            request.user.feed_items.all(), request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [item.recipe_id for item in items])
+        serializer = RecipeSerializer(
+            [recipes[item.recipe_id] for item in items
+             if item.recipe_id in recipes],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=['GET'],
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(TextShoppingListRenderer,
+                              CSVShoppingListRenderer,
+                              JSONShoppingListRenderer))
     def download_shopping_cart(self, request):
-        if not request.user.cart_items.exists():
+        shopping_list = request.user.shopping_list.all()
+        renderer = request.accepted_renderer
+        # ETag - хэш самих позиций списка и версии справочника
+        # ингредиентов, от которой зависят названия и единицы измерения.
+        digest = hashlib.md5(
+            f'{renderer.format}:{ingredients_cache.get_version()}'.encode())
+        rows = shopping_list.order_by('ingredient_id').values_list(
+            'ingredient_id', 'total_amount')
+        empty = True
+        for ingredient_id, total_amount in rows.iterator():
+            empty = False
+            digest.update(f':{ingredient_id}={total_amount}'.encode())
+        if empty:
             return Response(
                 'Корзина пуста',
                 status=status.HTTP_400_BAD_REQUEST)
-        recipes = Recipe.objects.filter(added_to_cart__user=request.user)
-        ingredients = (
-            IngredientRecipe.objects
-            .filter(recipe__in=recipes)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-        )
 
-        text = ''
-        for ingredient in ingredients:
-            text += (f'{ingredient["ingredient__name"]} - '
-                     f'{ingredient["total_amount"]} '
-                     f'{ingredient["ingredient__measurement_unit"]}.\n')
+        etag = quote_etag(digest.hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
 
-        file = HttpResponse(
-            f'Корзина:\n{text}', content_type='text/plain'
+        ingredients = (
+            shopping_list
+            .values('ingredient__name', 'ingredient__measurement_unit',
+                    'total_amount')
+            .order_by('ingredient__name')
         )
-
-        file['Content-Disposition'] = ('attachment; filename=cart.txt')
+        file = StreamingHttpResponse(
+            renderer.stream(ingredients.iterator()),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        file['Content-Disposition'] = (
+            f'attachment; filename=cart.{renderer.format}')
+        file['ETag'] = etag
         return file
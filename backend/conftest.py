@@ -0,0 +1,17 @@
+import pytest
+
+from api.querybudget import assert_action_budget
+
+
+@pytest.fixture
+def query_budget():
+    '''Проверяет, что запрос уложился в бюджет действия представления.
+
+    Бюджет берётся из атрибута query_budget класса; действие без
+    бюджета - ошибка. Повторяющиеся запросы (N+1) тоже приводят к ошибке.
+    '''
+    def check(view_class, action, make_request):
+        with assert_action_budget(view_class, action) as counter:
+            response = make_request()
+        return response, counter
+    return check
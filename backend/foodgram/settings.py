@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,27 @@ else:
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+CATALOGUE_CACHE_SIZE = 256
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = 20
+
+RECIPE_FLAGS_CACHE_TIMEOUT = 60 * 5
+RECIPE_PUBLIC_MAX_AGE = 60
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', default=0))
+RECIPE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
 AUTH_USER_MODEL = 'users.User'
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -142,5 +164,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend-static')
 MEDIA_URL = '/backend-media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend-media')
 
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': (320, 320),
+    'feed': (960, 960),
+}
+RECIPE_IMAGE_FORMAT = 'WEBP'
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_PIPELINE_BACKEND = os.getenv('IMAGE_PIPELINE_BACKEND', default='thread')
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', default=2))
+
+TRENDING_WINDOW_DAYS = 7
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_WEIGHTS = {'favorite': 1.0, 'shopping_cart': 0.5}
+
+FEED_FANOUT_MAX_FOLLOWERS = 5000
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_SIZE = 50
+
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE', default='') == 'True'
+QUERY_BUDGET_REPEAT_THRESHOLD = 5
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
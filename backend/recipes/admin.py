@@ -15,13 +15,14 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'image',
         'cooking_time',
+        'favorites_count',
+        'cart_count',
     )
     list_filter = ('name', 'author', 'tags')
     readonly_fields = ('get_favorite',)
 
     def get_favorite(self, obj):
-        count = obj.favorited_by.count()
-        return f'Добавлено в избранное {count} раз.'
+        return f'Добавлено в избранное {obj.favorites_count} раз.'
 
 
 @admin.register(Tag)
@@ -0,0 +1,115 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .cache import ingredients_cache
+from .models import Ingredient
+
+
+def normalize(value):
+    '''Приводит строку к виду для сравнения: регистр, «ё», пробелы.'''
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+def edit_distance(first, second, limit):
+    '''Расстояние Левенштейна; при превышении limit возвращает limit + 1.'''
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_char != second_char),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class IngredientIndex:
+    '''Отсортированный по нормализованному названию массив ингредиентов.
+
+    Поиск ранжирует совпадения так: сначала начало названия, затем
+    начало любого слова, затем подстрока, затем названия с опечаткой
+    в начале.
+    '''
+
+    def __init__(self, ingredients):
+        self.entries = sorted(
+            (normalize(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        self.keys = [entry[0] for entry in self.entries]
+
+    def search(self, query, limit):
+        query = normalize(query)
+        if not query:
+            return []
+        found = []
+        start = bisect_left(self.keys, query)
+        for entry in self.entries[start:]:
+            if not entry[0].startswith(query) or len(found) >= limit:
+                break
+            found.append(entry)
+        if len(found) < limit:
+            found.extend(self._search_substring(query, limit - len(found)))
+        if len(found) < limit and len(query) >= 3:
+            found.extend(self._search_typo(query, limit - len(found), found))
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in found
+        ]
+
+    def _search_substring(self, query, limit):
+        word_start, inside = [], []
+        for entry in self.entries:
+            position = entry[0].find(query)
+            if position > 0:
+                if entry[0][position - 1] == ' ':
+                    word_start.append(entry)
+                else:
+                    inside.append((position, entry))
+        inside.sort(key=lambda item: item[0])
+        return (word_start + [entry for _, entry in inside])[:limit]
+
+    def _search_typo(self, query, limit, found):
+        max_distance = 1 if len(query) < 6 else 2
+        start = bisect_left(self.keys, query[0])
+        end = bisect_left(self.keys, chr(ord(query[0]) + 1))
+        seen = {entry[1] for entry in found}
+        matches = []
+        for entry in self.entries[start:end]:
+            if entry[1] in seen:
+                continue
+            distance = edit_distance(
+                query, entry[0][:len(query)], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, entry))
+        matches.sort(key=lambda item: item[0])
+        return [entry for _, entry in matches[:limit]]
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    '''Индекс ингредиентов, пересобираемый при смене версии справочника.'''
+    global _index, _index_version
+    version = ingredients_cache.get_version()
+    if _index_version != version:
+        with _index_lock:
+            if _index_version != version:
+                _index = IngredientIndex(Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'))
+                _index_version = version
+    return _index
+
+
+def autocomplete_ingredients(query, limit=None):
+    return get_ingredient_index().search(
+        query, limit or settings.INGREDIENT_AUTOCOMPLETE_LIMIT)
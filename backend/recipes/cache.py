@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Tag
+
+
+class CatalogueCache:
+    '''Двухуровневый кэш справочника.
+
+    Значения хранятся в LRU-кэше процесса и в общем кэше Django. Ключи
+    содержат номер версии справочника, поэтому для сброса кэша во всех
+    процессах достаточно увеличить версию. Версия начинается со времени в
+    наносекундах: если общий кэш вытеснит её, новая версия не совпадёт с
+    прежними, и старые значения и ETag не станут снова действительными.
+    '''
+
+    def __init__(self, name, maxsize=None):
+        self.name = name
+        self.maxsize = maxsize or settings.CATALOGUE_CACHE_SIZE
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f'catalogue:{self.name}:version'
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump_version(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+
+    def get_or_set(self, key, default, version=None):
+        '''Возвращает значение по ключу, вычисляя его через default().'''
+        if version is None:
+            version = self.get_version()
+        full_key = f'catalogue:{self.name}:{version}:{key}'
+        with self._lock:
+            if full_key in self._local:
+                self._local.move_to_end(full_key)
+                return self._local[full_key]
+        value = cache.get(full_key)
+        if value is None:
+            value = default()
+            cache.set(full_key, value, settings.CATALOGUE_CACHE_TIMEOUT)
+        with self._lock:
+            self._local[full_key] = value
+            self._local.move_to_end(full_key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+        return value
+
+
+tags_cache = CatalogueCache('tags')
+ingredients_cache = CatalogueCache('ingredients')
+trending_cache = CatalogueCache('trending')
+
+
+def get_tag_ids_by_slug():
+    return tags_cache.get_or_set(
+        'ids_by_slug',
+        lambda: dict(Tag.objects.values_list('slug', 'id')),
+    )
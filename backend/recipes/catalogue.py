@@ -0,0 +1,211 @@
+import csv
+import io
+import json
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+
+from .cache import ingredients_cache
+from .models import Ingredient
+
+READ_CHUNK_SIZE = 64 * 1024
+SEPARATORS = ' \t\r\n,'
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    invalid: int = 0
+
+
+def _skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in SEPARATORS:
+        position += 1
+    return position
+
+
+def _read_opening_bracket(file, chunk_size):
+    buffer = ''
+    while not buffer.strip():
+        chunk = file.read(chunk_size)
+        if not chunk:
+            raise ValueError('Пустой файл')
+        buffer += chunk
+    buffer = buffer.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидался JSON-массив')
+    return buffer[1:]
+
+
+def iter_json_array(file, chunk_size=READ_CHUNK_SIZE):
+    '''Читает JSON-массив объектов по одному элементу, не загружая файл
+    целиком.'''
+    decoder = json.JSONDecoder()
+    buffer = _read_opening_bracket(file, chunk_size)
+    position = 0
+    eof = False
+    while True:
+        position = _skip_separators(buffer, position)
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError('JSON-массив повреждён или не закрыт')
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_csv_rows(file):
+    '''Строки CSV: название, единица измерения. Заголовок необязателен.'''
+    for number, row in enumerate(csv.reader(file)):
+        if not row or (number == 0 and row[0] == 'name'):
+            continue
+        yield {
+            'name': row[0],
+            'measurement_unit': row[1] if len(row) > 1 else '',
+        }
+
+
+def read_ingredients(file, file_format):
+    '''Пары (название, единица) из файла; некорректные строки - None.'''
+    rows = iter_csv_rows(file) if file_format == 'csv' else (
+        iter_json_array(file))
+    for row in rows:
+        name = str(row.get('name') or '').strip()
+        unit = str(row.get('measurement_unit') or '').strip()
+        if not name or not unit or len(name) > NAME_LENGTH or (
+                len(unit) > UNIT_LENGTH):
+            yield None
+        else:
+            yield name, unit
+
+
+def _batches(rows, batch_size, result):
+    batch = {}
+    for row in rows:
+        if row is None:
+            result.invalid += 1
+            continue
+        name, unit = row
+        batch[name] = unit
+        if len(batch) >= batch_size:
+            yield batch
+            batch = {}
+    if batch:
+        yield batch
+
+
+def _upsert_batch(batch, result, dry_run):
+    existing = Ingredient.objects.filter(name__in=list(batch)).only(
+        'pk', 'name', 'measurement_unit')
+    to_update = []
+    for ingredient in existing:
+        unit = batch.pop(ingredient.name)
+        if ingredient.measurement_unit == unit:
+            result.unchanged += 1
+        else:
+            ingredient.measurement_unit = unit
+            to_update.append(ingredient)
+    result.updated += len(to_update)
+    result.inserted += len(batch)
+    if dry_run:
+        return
+    with transaction.atomic():
+        Ingredient.objects.bulk_update(to_update, ['measurement_unit'])
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in batch.items()
+        )
+
+
+def upsert_ingredients(rows, batch_size=1000, dry_run=False):
+    '''Добавляет новые ингредиенты и обновляет единицы измерения
+    существующих (по названию) пачками по batch_size.'''
+    result = ImportResult()
+    for batch in _batches(rows, batch_size, result):
+        _upsert_batch(batch, result, dry_run)
+    if not dry_run and (result.inserted or result.updated):
+        ingredients_cache.bump_version()
+    return result
+
+
+class _CSVStream(io.RawIOBase):
+    '''Файлоподобный объект, отдающий строки как CSV для COPY.'''
+
+    def __init__(self, rows, result):
+        self.rows = rows
+        self.result = result
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def _next_line(self):
+        for row in self.rows:
+            if row is None:
+                self.result.invalid += 1
+                continue
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(row)
+            return buffer.getvalue().encode()
+        return b''
+
+    def readinto(self, target):
+        while len(self.pending) < len(target):
+            line = self._next_line()
+            if not line:
+                break
+            self.pending += line
+        size = min(len(target), len(self.pending))
+        target[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+COPY_UPSERT = f'''
+    INSERT INTO {Ingredient._meta.db_table} AS target (name, measurement_unit)
+    SELECT DISTINCT ON (name) name, measurement_unit
+    FROM ingredient_import ORDER BY name, line DESC
+    ON CONFLICT (name) DO UPDATE
+    SET measurement_unit = EXCLUDED.measurement_unit
+    WHERE target.measurement_unit IS DISTINCT FROM EXCLUDED.measurement_unit
+    RETURNING xmax = 0
+'''
+
+
+def copy_ingredients(rows, dry_run=False):
+    '''То же, что upsert_ingredients, но через COPY во временную таблицу
+    и один INSERT ... ON CONFLICT. Только для PostgreSQL.'''
+    result = ImportResult()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE ingredient_import ('
+            'line serial, name text, measurement_unit text'
+            ') ON COMMIT DROP')
+        cursor.copy_expert(
+            'COPY ingredient_import (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)',
+            io.BufferedReader(_CSVStream(rows, result)),
+        )
+        cursor.execute('SELECT count(DISTINCT name) FROM ingredient_import')
+        total = cursor.fetchone()[0]
+        cursor.execute(COPY_UPSERT)
+        changes = [inserted for inserted, in cursor.fetchall()]
+        result.inserted = sum(changes)
+        result.updated = len(changes) - result.inserted
+        result.unchanged = total - len(changes)
+        if dry_run:
+            transaction.set_rollback(True)
+    if not dry_run and (result.inserted or result.updated):
+        ingredients_cache.bump_version()
+    return result
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Following, User
+from .models import FavoriteRecipe, Recipe, ShoppingCart
+
+RECONCILE_BATCH_SIZE = 500
+
+# Модель и поле счётчика, модель-источник и её ссылка на владельца счётчика.
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Following, 'to_follow'),
+)
+
+# Счётчики рецепта, которые ведут отметки пользователей.
+RECIPE_COUNTERS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCart: 'cart_count',
+}
+
+
+def change_counter(model, field, pks, delta):
+    '''Атомарно изменяет счётчик на delta у объектов с переданными pk.'''
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def actual_count(source, lookup):
+    return Coalesce(Subquery(
+        source.objects
+        .filter(**{lookup: OuterRef('pk')})
+        .order_by()
+        .values(lookup)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def reconcile_counters(dry_run=False):
+    '''Сверяет счётчики с фактическим числом записей.
+
+    Возвращает словарь {поле: число исправленных объектов}.
+    '''
+    fixed = {}
+    for model, field, source, lookup in COUNTERS:
+        drifted = list(
+            model.objects
+            .annotate(actual=actual_count(source, lookup))
+            .exclude(**{field: F('actual')})
+            .values_list('pk', flat=True)
+        )
+        fixed[f'{model._meta.model_name}.{field}'] = len(drifted)
+        if dry_run:
+            continue
+        for start in range(0, len(drifted), RECONCILE_BATCH_SIZE):
+            with transaction.atomic():
+                model.objects.filter(
+                    pk__in=drifted[start:start + RECONCILE_BATCH_SIZE],
+                ).update(**{field: actual_count(source, lookup)})
+    return fixed
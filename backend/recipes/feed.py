@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.db.models import Max, Q
+
+from users.models import Following
+from .models import FeedItem, Recipe
+
+
+def _create_items(items):
+    FeedItem.objects.bulk_create(
+        items,
+        batch_size=settings.FEED_FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def is_pulled_author(author):
+    '''Рецепты популярных авторов не рассылаются, а забираются при чтении.'''
+    return author.followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out_recipe(recipe):
+    '''Добавляет новый рецепт в ленты подписчиков автора.'''
+    if is_pulled_author(recipe.author):
+        return
+    follower_ids = (
+        Following.objects
+        .filter(to_follow_id=recipe.author_id)
+        .values_list('follower_id', flat=True)
+        .order_by()
+    )
+    _create_items(
+        FeedItem(user_id=user_id, recipe_id=recipe.pk, created=recipe.created)
+        for user_id in follower_ids.iterator()
+    )
+
+
+def _recent_recipes(author_id):
+    return list(
+        Recipe.objects
+        .filter(author_id=author_id)
+        .order_by('-created')
+        .values_list('pk', 'created')[:settings.FEED_BACKFILL_SIZE]
+    )
+
+
+def _add_to_feed(user_id, recipes):
+    _create_items(
+        FeedItem(user_id=user_id, recipe_id=recipe_id, created=created)
+        for recipe_id, created in recipes
+    )
+
+
+def add_author_to_feed(user_id, author_id, recipes=None):
+    '''После подписки кладёт в ленту последние рецепты автора.'''
+    if recipes is None:
+        recipes = _recent_recipes(author_id)
+    _add_to_feed(user_id, recipes)
+
+
+def remove_author_from_feed(user_id, author_id):
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+def pull_feed(user):
+    '''Добавляет в ленту новые рецепты популярных авторов.
+
+    Эти рецепты при публикации не рассылаются, поэтому лента догоняет
+    их при чтении: рецепты новее последнего уже попавшего в неё читаются
+    по возрастанию даты пачками по FEED_BACKFILL_SIZE, пока не кончатся.
+    '''
+    author_ids = list(
+        Following.objects
+        .filter(follower=user,
+                to_follow__followers_count__gt=(
+                    settings.FEED_FANOUT_MAX_FOLLOWERS))
+        .values_list('to_follow_id', flat=True)
+    )
+    if not author_ids:
+        return
+    last_pulled = FeedItem.objects.filter(
+        user=user, recipe__author_id__in=author_ids,
+    ).aggregate(last=Max('created'))['last']
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if last_pulled is None:
+        _add_to_feed(user.pk, recipes.order_by('-created').values_list(
+            'pk', 'created')[:settings.FEED_BACKFILL_SIZE])
+        return
+    recipes = recipes.order_by('created', 'pk').values_list('pk', 'created')
+    after = Q(created__gt=last_pulled)
+    while True:
+        batch = list(recipes.filter(after)[:settings.FEED_BACKFILL_SIZE])
+        _add_to_feed(user.pk, batch)
+        if len(batch) < settings.FEED_BACKFILL_SIZE:
+            return
+        last_pk, last_created = batch[-1]
+        after = (Q(created__gt=last_created)
+                 | Q(created=last_created, pk__gt=last_pk))
+
+
+def backfill_feeds():
+    '''Заполняет ленты всех подписчиков последними рецептами авторов.
+
+    Возвращает число обработанных подписок.
+    '''
+    follows = (
+        Following.objects
+        .values_list('to_follow_id', 'follower_id')
+        .order_by('to_follow_id')
+    )
+    processed = 0
+    author_id = recipes = None
+    for follow_author_id, follower_id in follows.iterator():
+        if follow_author_id != author_id:
+            author_id = follow_author_id
+            recipes = _recent_recipes(author_id)
+        add_author_to_feed(follower_id, author_id, recipes)
+        processed += 1
+    return processed
@@ -0,0 +1,142 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions/'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_rendition_prefix(image_name):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{RENDITIONS_DIR}{stem}_'
+
+
+def has_actual_renditions(recipe):
+    prefix = get_rendition_prefix(recipe.image.name)
+    return all(
+        getattr(recipe, f'image_{name}').name.startswith(prefix)
+        for name in settings.RECIPE_IMAGE_RENDITIONS
+    )
+
+
+def clear_renditions(recipe):
+    '''Сбрасывает копии, построенные не для текущего изображения рецепта.
+
+    Файлы удаляются после фиксации транзакции, поля - сразу, чтобы в
+    ответе не оказались ссылки на копии прежнего изображения.
+    '''
+    prefix = get_rendition_prefix(recipe.image.name) if recipe.image else None
+    stale = {}
+    for name in settings.RECIPE_IMAGE_RENDITIONS:
+        field = getattr(recipe, f'image_{name}')
+        if field and not (prefix and field.name.startswith(prefix)):
+            stale[field.field.name] = field
+    if not stale:
+        return
+    Recipe.objects.filter(pk=recipe.pk, image=recipe.image.name).update(
+        **{name: '' for name in stale})
+    files = [(field.storage, field.name) for field in stale.values()]
+    for name in stale:
+        setattr(recipe, name, '')
+    transaction.on_commit(lambda: delete_files(files))
+
+
+def delete_files(files):
+    for storage, name in files:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Не удалось удалить файл %s', name)
+
+
+def render_image(image, size, image_format):
+    '''Уменьшает изображение и кодирует его заново, без EXIF.'''
+    rendition = image.copy()
+    rendition.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and rendition.mode not in ('RGB', 'L'):
+        rendition = rendition.convert('RGB')
+    buffer = io.BytesIO()
+    rendition.save(buffer, format=image_format,
+                   quality=settings.RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def build_renditions(recipe_id):
+    '''Строит уменьшенные копии изображения рецепта.'''
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    image_name = recipe.image.name
+    image_format = settings.RECIPE_IMAGE_FORMAT
+    extension = image_format.lower().replace('jpeg', 'jpg')
+    with recipe.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+
+    renditions = {}
+    prefix = get_rendition_prefix(image_name)
+    for name, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        field = getattr(recipe, f'image_{name}')
+        field.save(
+            f'{os.path.basename(prefix)}{name}.{extension}',
+            ContentFile(render_image(image, size, image_format)),
+            save=False,
+        )
+        renditions[f'image_{name}'] = field
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        updated=timezone.now(),
+        **{name: field.name for name, field in renditions.items()},
+    )
+    if not updated:
+        # Изображение сменилось, пока строились копии.
+        delete_files(
+            (field.storage, field.name) for field in renditions.values())
+
+
+def _run(recipe_id):
+    close_old_connections()
+    try:
+        build_renditions(recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось обработать изображение рецепта %s', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PIPELINE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+    return _executor
+
+
+def schedule_renditions(recipe_id):
+    '''Ставит обработку изображения в очередь после фиксации транзакции.
+
+    Бэкенд 'thread' обрабатывает изображения в пуле потоков процесса,
+    'sync' - сразу, в том же потоке (для тестов и отладки).
+    '''
+    if settings.IMAGE_PIPELINE_BACKEND == 'sync':
+        transaction.on_commit(lambda: build_renditions(recipe_id))
+    else:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run, recipe_id))
@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+
+from recipes.feed import backfill_feeds
+
+
+class Command(BaseCommand):
+    help = ('Заполняет ленты подписок последними рецептами авторов. '
+            'Повторный запуск безопасен: существующие записи пропускаются.')
+
+    def handle(self, *args, **options):
+        processed = backfill_feeds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано подписок: {processed}.'))
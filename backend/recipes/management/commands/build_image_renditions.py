@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+
+from recipes.images import build_renditions, has_actual_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит недостающие уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересобрать копии для всех рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        for recipe in Recipe.objects.exclude(image='').iterator():
+            if not options['force'] and has_actual_renditions(recipe):
+                continue
+            try:
+                build_renditions(recipe.pk)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {built}, ошибок: {failed}.'))
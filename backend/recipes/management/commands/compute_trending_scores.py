@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+
+from recipes.trending import compute_trending_scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярных рецептов по недавней '
+            'активности. Запускается периодически, например из cron.')
+
+    def handle(self, *args, **options):
+        count = compute_trending_scores()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан для {count} рецептов.'))
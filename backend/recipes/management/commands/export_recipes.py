@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management import BaseCommand
+
+from recipes.transfer import export_recipes
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с тегами, ингредиентами и путями к '
+            'изображениям в формате JSON lines.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='Файл для выгрузки; по умолчанию - стандартный вывод.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['path'] is None:
+            export_recipes(sys.stdout, options['batch_size'])
+            return
+        with open(options['path'], 'w', encoding='utf8') as file:
+            exported = export_recipes(file, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}.'))
@@ -0,0 +1,44 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.transfer import RecipeImporter
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из JSON lines, созданного export_recipes. '
+            'Рецепты с уже существующими названиями пропускаются. После '
+            'загрузки стоит запустить build_image_renditions и '
+            'backfill_feeds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSON lines.')
+        parser.add_argument(
+            '--media-root',
+            help='Каталог с изображениями исходного окружения; без него '
+                 'пути к изображениям сохраняются как есть.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Число потоков для копирования изображений.',
+        )
+
+    def handle(self, *args, **options):
+        importer = RecipeImporter(
+            media_root=options['media_root'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+        )
+        try:
+            with open(options['path'], encoding='utf8') as file:
+                result = importer.run(file)
+        except FileNotFoundError:
+            raise CommandError(f'Файл {options["path"]} не найден.')
+        except (ValueError, KeyError) as error:
+            raise CommandError(f'Некорректная запись: {error}')
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено: {result.imported}, уже существовали: '
+            f'{result.existing}, с ошибками: {len(result.errors)}.'))
@@ -1,23 +1,72 @@
-import json
 import os
 
 from django.conf import settings
 from django.core.management import BaseCommand, CommandError
+from django.db import connection
 
-from recipes.models import Ingredient
+from recipes.catalogue import (copy_ingredients, read_ingredients,
+                               upsert_ingredients)
+
+FORMATS = ('json', 'csv')
 
 
 class Command(BaseCommand):
+    help = ('Загружает справочник ингредиентов из JSON или CSV: добавляет '
+            'новые и обновляет единицы измерения существующих.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.json'),
+            help='Файл со справочником (по умолчанию ingredients.json).',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать изменения, ничего не записывая.',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='PostgreSQL: загрузить файл через COPY во временную '
+                 'таблицу и применить одним запросом.',
+        )
+
+    def get_format(self, path, file_format):
+        file_format = file_format or os.path.splitext(path)[1][1:].lower()
+        if file_format not in FORMATS:
+            raise CommandError(
+                f'Неизвестный формат файла {path}: укажите --format.')
+        return file_format
 
     def handle(self, *args, **options):
+        path = options['path']
+        file_format = self.get_format(path, options['format'])
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только в PostgreSQL.')
         try:
-            path = os.path.join(
-                settings.BASE_DIR, './', 'ingredients.json',
-            )
-            ingredients = json.load(open(path, 'r', encoding='utf8'))
-            Ingredient.objects.bulk_create(
-                [Ingredient(**ingredient) for ingredient in ingredients],
-                ignore_conflicts=True,
-            )
+            with open(path, encoding='utf8', newline='') as file:
+                rows = read_ingredients(file, file_format)
+                if options['copy']:
+                    result = copy_ingredients(rows, options['dry_run'])
+                else:
+                    result = upsert_ingredients(
+                        rows, options['batch_size'], options['dry_run'])
         except FileNotFoundError:
-            raise CommandError('Добавьте файл ingredients в папку data')
+            raise CommandError(f'Файл {path} не найден.')
+        except ValueError as error:
+            raise CommandError(f'Ошибка в файле {path}: {error}')
+        report = (f'Добавлено: {result.inserted}, '
+                  f'обновлено: {result.updated}, '
+                  f'без изменений: {result.unchanged}, '
+                  f'пропущено некорректных строк: {result.invalid}.')
+        if options['dry_run']:
+            report = f'Пробный запуск, изменения не записаны. {report}'
+        self.stdout.write(self.style.SUCCESS(report))
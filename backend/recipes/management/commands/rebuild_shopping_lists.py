@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.services import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает списки покупок по содержимому корзин.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить списки, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        created, updated, deleted = rebuild_shopping_lists(
+            dry_run=options['check'])
+        report = (f'Добавлено: {created}, исправлено: {updated}, '
+                  f'удалено: {deleted}.')
+        if options['check'] and any((created, updated, deleted)):
+            raise CommandError(f'Списки покупок расходятся с корзинами. '
+                               f'{report}')
+        self.stdout.write(self.style.SUCCESS(report))
@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, корзин, рецептов и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить счётчики, ничего не изменяя.',
+        )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters(dry_run=options['check'])
+        report = ', '.join(
+            f'{field}: {count}' for field, count in fixed.items())
+        if options['check'] and any(fixed.values()):
+            raise CommandError(f'Счётчики расходятся с данными. {report}')
+        self.stdout.write(self.style.SUCCESS(f'Исправлено: {report}.'))
@@ -0,0 +1,201 @@
+import random
+from datetime import timedelta
+from operator import attrgetter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.cache import ingredients_cache, tags_cache
+from recipes.counters import reconcile_counters
+from recipes.feed import backfill_feeds
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, Tag)
+from recipes.search import index_recipes
+from recipes.services import rebuild_shopping_lists
+from recipes.trending import compute_trending_scores
+from recipes.utils import RecipeTag, batched, fetch_created_recipes
+from users.models import Following, User
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_IMAGE = 'recipes/bench.png'
+ACTIVITY_DAYS = 14
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'паста', 'омлет',
+    'котлеты', 'блины', 'плов', 'борщ', 'жаркое', 'соус', 'десерт', 'хлеб',
+)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими данными для нагрузочных тестов. '
+            'При одинаковом --seed данные получаются одинаковыми.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Сколько ингредиентов создать, если '
+                                 'справочник пуст.')
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=15)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя.')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Среднее число избранных рецептов.')
+        parser.add_argument('--cart', type=int, default=8,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f'bench{options["seed"]}'
+        if User.objects.filter(
+                username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(
+                f'Данные с --seed {options["seed"]} уже созданы.')
+        self.now = timezone.now()
+
+        tag_ids = self.create_tags(options['tags'])
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, tag_ids, ingredient_ids,
+            (options['min_ingredients'], options['max_ingredients']))
+        self.create_follows(user_ids, options['follows'])
+        self.create_marks(FavoriteRecipe, user_ids, recipe_ids,
+                          options['favorites'])
+        self.create_marks(ShoppingCart, user_ids, recipe_ids,
+                          options['cart'])
+        self.rebuild_derived_data()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}. Пароль: {BENCH_PASSWORD}'))
+
+    def bulk_create(self, model, objects):
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def create_tags(self, count):
+        self.bulk_create(Tag, (
+            Tag(name=f'{self.prefix} тег {i}', slug=f'{self.prefix}-{i}',
+                color=f'#{self.rng.randrange(0x1000000):06X}')
+            for i in range(count)
+        ))
+        tags_cache.bump_version()
+        return list(Tag.objects.filter(
+            slug__startswith=f'{self.prefix}-',
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_ingredients(self, count):
+        if not Ingredient.objects.exists():
+            self.bulk_create(Ingredient, (
+                Ingredient(name=f'ингредиент {i}',
+                           measurement_unit=self.rng.choice(('г', 'мл', 'шт')))
+                for i in range(count)
+            ))
+            ingredients_cache.bump_version()
+        return list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_users(self, count):
+        password = make_password(BENCH_PASSWORD)
+        self.bulk_create(User, (
+            User(username=f'{self.prefix}_{i}',
+                 email=f'{self.prefix}_{i}@bench.local',
+                 first_name='Тест', last_name=f'Пользователь {i}',
+                 password=password)
+            for i in range(count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=f'{self.prefix}_',
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def recipe_name(self, number):
+        words = self.rng.sample(WORDS, 2)
+        return f'{words[0].capitalize()} {words[1]} {self.prefix}-{number}'
+
+    def create_recipes(self, count, user_ids, tag_ids, ingredient_ids,
+                       ingredient_range):
+        recipe_ids = []
+        for batch in batched(range(count), self.batch_size):
+            with transaction.atomic():
+                recipes = [
+                    Recipe(
+                        name=self.recipe_name(number),
+                        author_id=self.rng.choice(user_ids),
+                        text=' '.join(self.rng.choices(WORDS, k=30)),
+                        cooking_time=self.rng.randint(5, 180),
+                        image=BENCH_IMAGE,
+                    )
+                    for number in batch
+                ]
+                Recipe.objects.bulk_create(recipes)
+                recipes = sorted(
+                    fetch_created_recipes(
+                        [recipe.name for recipe in recipes]).values(),
+                    key=attrgetter('pk'))
+                self.add_recipe_relations(
+                    recipes, tag_ids, ingredient_ids, ingredient_range)
+                index_recipes(recipes)
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+        return recipe_ids
+
+    def add_recipe_relations(self, recipes, tag_ids, ingredient_ids,
+                             ingredient_range):
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe in recipes
+            for tag_id in self.rng.sample(
+                tag_ids, min(len(tag_ids), self.rng.randint(1, 3)))
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                             amount=self.rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient_id in self.rng.sample(
+                ingredient_ids,
+                min(len(ingredient_ids), self.rng.randint(*ingredient_range)))
+        )
+
+    def sample_count(self, mean, limit):
+        return min(limit, self.rng.randint(0, 2 * mean))
+
+    def skewed_sample(self, ids, count):
+        '''Выборка с перекосом к началу списка: немногие популярны.'''
+        return {
+            ids[min(int(self.rng.paretovariate(1.2)) - 1, len(ids) - 1)]
+            if self.rng.random() < 0.5 else self.rng.choice(ids)
+            for _ in range(count)
+        }
+
+    def create_follows(self, user_ids, mean):
+        self.bulk_create(Following, (
+            Following(follower_id=user_id, to_follow_id=author_id)
+            for user_id in user_ids
+            for author_id in self.skewed_sample(
+                user_ids, self.sample_count(mean, len(user_ids) - 1))
+            if author_id != user_id
+        ))
+
+    def create_marks(self, model, user_ids, recipe_ids, mean):
+        period = timedelta(days=ACTIVITY_DAYS).total_seconds()
+        self.bulk_create(model, (
+            model(user_id=user_id, recipe_id=recipe_id,
+                  created=self.now - timedelta(
+                      seconds=self.rng.uniform(0, period)))
+            for user_id in user_ids
+            for recipe_id in self.skewed_sample(
+                recipe_ids, self.sample_count(mean, len(recipe_ids)))
+        ))
+
+    def rebuild_derived_data(self):
+        '''bulk_create обходит сигналы: пересчитываем производные данные.'''
+        reconcile_counters()
+        rebuild_shopping_lists()
+        backfill_feeds()
+        compute_trending_scores()
@@ -0,0 +1,87 @@
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .counters import RECIPE_COUNTERS, change_counter
+from .membership import invalidate_recipe_flags
+from .models import FavoriteRecipe, Recipe, ShoppingCart
+from .services import add_to_shopping_list, remove_from_shopping_list
+
+MARK_BATCH_LIMIT = 100
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _execute(model, sql, params):
+    with connections[model.objects.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def _on_added(model, user_id, recipe_ids):
+    change_counter(Recipe, RECIPE_COUNTERS[model], recipe_ids, 1)
+    if model is ShoppingCart:
+        add_to_shopping_list(user_id, recipe_ids)
+    invalidate_recipe_flags(user_id)
+
+
+def _on_removed(model, user_id, recipe_ids):
+    change_counter(Recipe, RECIPE_COUNTERS[model], recipe_ids, -1)
+    if model is ShoppingCart:
+        remove_from_shopping_list(user_id, recipe_ids)
+    invalidate_recipe_flags(user_id)
+
+
+def add_marks(model, user_id, recipe_ids):
+    '''Добавляет рецепты в избранное или корзину одним запросом.
+
+    Уже отмеченные и несуществующие рецепты пропускаются; возвращает
+    отсортированный список id, которые действительно были добавлены.
+    Запрос идёт в обход сигналов, поэтому связанные данные обновляются
+    здесь же.
+    '''
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return []
+    sql = (
+        f'INSERT INTO {model._meta.db_table} (user_id, recipe_id, created) '
+        f'SELECT %s, id, %s FROM {Recipe._meta.db_table} '
+        f'WHERE id IN ({_placeholders(recipe_ids)}) '
+        'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+        'RETURNING recipe_id'
+    )
+    created = connections[model.objects.db].ops.adapt_datetimefield_value(
+        timezone.now())
+    with transaction.atomic():
+        added = _execute(model, sql, [user_id, created, *recipe_ids])
+        if added:
+            _on_added(model, user_id, added)
+    return added
+
+
+def remove_marks(model, user_id, recipe_ids):
+    '''Убирает рецепты из избранного или корзины одним запросом.
+
+    Возвращает отсортированный список id, которые действительно были
+    удалены.
+    '''
+    recipe_ids = sorted(set(recipe_ids))
+    if not recipe_ids:
+        return []
+    sql = (
+        f'DELETE FROM {model._meta.db_table} '
+        f'WHERE user_id = %s AND recipe_id IN ({_placeholders(recipe_ids)}) '
+        'RETURNING recipe_id'
+    )
+    with transaction.atomic():
+        removed = _execute(model, sql, [user_id, *recipe_ids])
+        if removed:
+            _on_removed(model, user_id, removed)
+    return removed
+
+
+MARK_MODELS = {
+    'favorite': FavoriteRecipe,
+    'shopping_cart': ShoppingCart,
+}
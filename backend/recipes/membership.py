@@ -0,0 +1,102 @@
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import IntegerField, Value
+
+from .models import FavoriteRecipe, ShoppingCart
+
+FAVORITE = 1
+IN_CART = 2
+
+
+def _contains(ids, recipe_id):
+    position = bisect_left(ids, recipe_id)
+    return position < len(ids) and ids[position] == recipe_id
+
+
+class RecipeFlags:
+    '''Отсортированные id избранных рецептов и рецептов в корзине.'''
+
+    def __init__(self, favorites=(), cart=()):
+        self.favorites = array('q', sorted(favorites))
+        self.cart = array('q', sorted(cart))
+
+    def is_favorited(self, recipe_id):
+        return _contains(self.favorites, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return _contains(self.cart, recipe_id)
+
+    @classmethod
+    def load(cls, user_id):
+        '''Загружает оба множества одним запросом.'''
+        favorites = FavoriteRecipe.objects.filter(user_id=user_id).annotate(
+            kind=Value(FAVORITE, output_field=IntegerField()),
+        ).values_list('recipe_id', 'kind')
+        cart = ShoppingCart.objects.filter(user_id=user_id).annotate(
+            kind=Value(IN_CART, output_field=IntegerField()),
+        ).values_list('recipe_id', 'kind')
+        rows = list(favorites.union(cart, all=True))
+        return cls(
+            favorites=(recipe_id for recipe_id, kind in rows
+                       if kind == FAVORITE),
+            cart=(recipe_id for recipe_id, kind in rows if kind == IN_CART),
+        )
+
+
+def _generation_key(user_id):
+    return f'recipe_flags_generation:{user_id}'
+
+
+def _new_generation():
+    # Если счётчик поколений вытеснен из кэша, новое значение не должно
+    # совпасть с прежним, иначе снова станут видны устаревшие флаги.
+    return time.time_ns()
+
+
+def _cache_key(user_id):
+    '''Ключ флагов текущего поколения пользователя.'''
+    generation_key = _generation_key(user_id)
+    generation = cache.get(generation_key)
+    if generation is None:
+        cache.add(generation_key, _new_generation(), None)
+        generation = cache.get(generation_key)
+    return f'recipe_flags:{user_id}:{generation}'
+
+
+def get_recipe_flags(request):
+    '''Флаги пользователя запроса: из запроса, из кэша или из базы.
+
+    Ключ кэша читается до загрузки флагов из базы. Если отметки изменятся
+    во время загрузки, invalidate_recipe_flags сменит поколение, и
+    записанные под старым ключом флаги больше не будут прочитаны.
+    '''
+    flags = getattr(request, '_recipe_flags', None)
+    if flags is not None:
+        return flags
+    user = request.user
+    if not user.is_authenticated:
+        flags = RecipeFlags()
+    else:
+        key = _cache_key(user.pk)
+        flags = cache.get(key)
+        if flags is None:
+            flags = RecipeFlags.load(user.pk)
+            cache.set(key, flags, settings.RECIPE_FLAGS_CACHE_TIMEOUT)
+    request._recipe_flags = flags
+    return flags
+
+
+def _next_generation(user_id):
+    try:
+        cache.incr(_generation_key(user_id))
+    except ValueError:
+        cache.set(_generation_key(user_id), _new_generation(), None)
+
+
+def invalidate_recipe_flags(user_id):
+    transaction.on_commit(lambda: _next_generation(user_id))
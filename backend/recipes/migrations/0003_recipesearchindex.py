@@ -0,0 +1,93 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:13
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+from django.contrib.postgres.search import SearchVector
+
+POSTGRESQL_FORWARD = (
+    'CREATE INDEX recipes_search_vector_gin '
+    'ON recipes_recipesearchindex USING gin (vector)',
+)
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX IF EXISTS recipes_search_vector_gin',
+)
+SQLITE_FORWARD = (
+    "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+    "title, body, content='recipes_recipesearchindex', "
+    "content_rowid='recipe_id')",
+    'CREATE TRIGGER recipes_recipe_fts_insert '
+    'AFTER INSERT ON recipes_recipesearchindex BEGIN '
+    'INSERT INTO recipes_recipe_fts(rowid, title, body) '
+    'VALUES (new.recipe_id, new.title, new.body); END',
+    'CREATE TRIGGER recipes_recipe_fts_delete '
+    'AFTER DELETE ON recipes_recipesearchindex BEGIN '
+    'INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, title, body) '
+    "VALUES ('delete', old.recipe_id, old.title, old.body); END",
+    'CREATE TRIGGER recipes_recipe_fts_update '
+    'AFTER UPDATE ON recipes_recipesearchindex BEGIN '
+    'INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, title, body) '
+    "VALUES ('delete', old.recipe_id, old.title, old.body); "
+    'INSERT INTO recipes_recipe_fts(rowid, title, body) '
+    'VALUES (new.recipe_id, new.title, new.body); END',
+)
+SQLITE_BACKWARD = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor)
+        for statement in vendor_statements or ():
+            schema_editor.execute(statement)
+    return run
+
+
+def fill_search_index(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeSearchIndex = apps.get_model('recipes', 'RecipeSearchIndex')
+    RecipeSearchIndex.objects.bulk_create(
+        (RecipeSearchIndex(recipe_id=pk, title=name, body=text)
+         for pk, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text').iterator()),
+        batch_size=500,
+    )
+    if schema_editor.connection.vendor == 'postgresql':
+        RecipeSearchIndex.objects.update(vector=(
+            SearchVector('title', weight='A', config='russian')
+            + SearchVector('body', weight='B', config='russian')
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchIndex',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('body', models.TextField(verbose_name='Текст')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True, verbose_name='Поисковый вектор')),
+            ],
+            options={
+                'verbose_name': 'Поисковый индекс рецепта',
+                'verbose_name_plural': 'Поисковый индекс рецептов',
+            },
+        ),
+        migrations.RunPython(
+            run_vendor_sql({'postgresql': POSTGRESQL_FORWARD,
+                            'sqlite': SQLITE_FORWARD}),
+            run_vendor_sql({'postgresql': POSTGRESQL_BACKWARD,
+                            'sqlite': SQLITE_BACKWARD}),
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_feed',
+            field=models.ImageField(blank=True, upload_to='recipes/renditions/', verbose_name='Изображение для ленты'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, upload_to='recipes/renditions/', verbose_name='Миниатюра'),
+        ),
+    ]
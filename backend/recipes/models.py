@@ -1,5 +1,7 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
@@ -84,6 +86,16 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='recipes/',
     )
+    image_thumbnail = models.ImageField(
+        verbose_name='Миниатюра',
+        upload_to='recipes/renditions/',
+        blank=True,
+    )
+    image_feed = models.ImageField(
+        verbose_name='Изображение для ленты',
+        upload_to='recipes/renditions/',
+        blank=True,
+    )
     tags = models.ManyToManyField(
         Tag,
         verbose_name='Теги',
@@ -97,11 +109,43 @@ class Recipe(models.Model):
         verbose_name='Дата создания',
         auto_now_add=True,
     )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    cart_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в корзину',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-created', '-id'),
+                name='recipe_created_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-created'),
+                name='recipe_author_created_idx',
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=('cooking_time', '-id'),
+                name='recipe_quick_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -115,6 +159,72 @@ class Recipe(models.Model):
              self.ingredients.all()])
 
 
+class RecipeSearchIndex(models.Model):
+    '''Поисковый документ рецепта.
+
+    В PostgreSQL поиск идёт по GIN-индексу на vector, в SQLite - по
+    FTS5-таблице recipes_recipe_fts, которую синхронизируют триггеры.
+    '''
+
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_index',
+    )
+    title = models.CharField(
+        verbose_name='Заголовок',
+        max_length=200,
+    )
+    body = models.TextField(
+        verbose_name='Текст',
+    )
+    vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = 'Поисковый индекс рецепта'
+        verbose_name_plural = 'Поисковый индекс рецептов'
+
+    def __str__(self):
+        return self.title
+
+
+class RecipeTrendingScore(models.Model):
+    '''Рейтинг рецепта по недавней активности.
+
+    Пересчитывается командой compute_trending_scores; рецепты без
+    активности за последнее время в таблицу не попадают.
+    '''
+
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending_score',
+    )
+    score = models.FloatField(
+        verbose_name='Рейтинг',
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = (
+            models.Index(
+                fields=('-score', '-recipe'),
+                name='trending_score_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score:.2f}'
+
+
 class IngredientRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -154,6 +264,11 @@ class FavoriteRecipe(models.Model):
         on_delete=models.CASCADE,
         related_name='favorited_by',
     )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        default=timezone.now,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -164,6 +279,12 @@ class FavoriteRecipe(models.Model):
                 name='unique_favorite',
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('recipe', 'user'),
+                name='favorite_recipe_user_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.recipe.name} авторства {self.user}.'
@@ -182,6 +303,11 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='added_to_cart',
     )
+    created = models.DateTimeField(
+        verbose_name='Дата добавления',
+        default=timezone.now,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -192,3 +318,84 @@ class ShoppingCart(models.Model):
                 name='unique_cart',
             ),
         ]
+        indexes = (
+            models.Index(
+                fields=('recipe', 'user'),
+                name='cart_recipe_user_idx',
+            ),
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.total_amount} {self.ingredient}.'
+
+
+class FeedItem(models.Model):
+    '''Рецепт в ленте подписок пользователя.
+
+    Строки пишутся при публикации рецепта всем подписчикам автора;
+    рецепты авторов с очень большим числом подписчиков добавляются в
+    ленту при её чтении.
+    '''
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item',
+            ),
+        ]
+        indexes = (
+            models.Index(
+                fields=('user', '-created', '-id'),
+                name='feed_item_user_created_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe_id}.'
@@ -0,0 +1,72 @@
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import F, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import RecipeSearchIndex
+
+SEARCH_CONFIG = 'russian'
+SEARCH_VECTOR = (
+    SearchVector('title', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('body', weight='B', config=SEARCH_CONFIG)
+)
+
+
+def update_search_index(recipe):
+    RecipeSearchIndex.objects.update_or_create(
+        recipe=recipe,
+        defaults={'title': recipe.name, 'body': recipe.text},
+    )
+    if connections[recipe._state.db].vendor == 'postgresql':
+        RecipeSearchIndex.objects.filter(recipe=recipe).update(
+            vector=SEARCH_VECTOR)
+
+
+def index_recipes(recipes, batch_size=1000):
+    '''Создаёт поисковые документы для рецептов, добавленных в обход
+    сигналов (например, через bulk_create).'''
+    recipes = list(recipes)
+    RecipeSearchIndex.objects.bulk_create(
+        (RecipeSearchIndex(recipe=recipe, title=recipe.name, body=recipe.text)
+         for recipe in recipes),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    if recipes and connections[recipes[0]._state.db].vendor == 'postgresql':
+        RecipeSearchIndex.objects.filter(recipe__in=recipes).update(
+            vector=SEARCH_VECTOR)
+
+
+def _fts5_query(query):
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+def search_recipes(queryset, query):
+    '''Фильтрует рецепты по запросу и добавляет релевантность search_rank.'''
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(
+            search_index__vector=search_query,
+        ).annotate(
+            search_rank=SearchRank(F('search_index__vector'), search_query),
+        )
+    fts_query = _fts5_query(query)
+    if not fts_query:
+        return queryset.annotate(
+            search_rank=Value(0.0, output_field=FloatField())).none()
+    return queryset.filter(pk__in=RawSQL(
+        'SELECT rowid FROM recipes_recipe_fts '
+        'WHERE recipes_recipe_fts MATCH %s',
+        (fts_query,),
+    )).annotate(search_rank=RawSQL(
+        'SELECT -bm25(recipes_recipe_fts, 10.0, 1.0) '
+        'FROM recipes_recipe_fts '
+        'WHERE recipes_recipe_fts MATCH %s '
+        'AND rowid = recipes_recipe.id',
+        (fts_query,),
+        output_field=FloatField(),
+    ))
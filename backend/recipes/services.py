@@ -0,0 +1,144 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+REBUILD_BATCH_SIZE = 500
+
+
+def get_recipe_amounts(recipe_ids):
+    '''Суммарное количество каждого ингредиента в переданных рецептах.'''
+    return dict(
+        IngredientRecipe.objects
+        .filter(recipe_id__in=recipe_ids)
+        .values_list('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+
+
+@transaction.atomic
+def change_shopping_lists(user_ids, deltas):
+    '''Применяет изменения количества ингредиентов к спискам покупок.
+
+    deltas - словарь {id ингредиента: на сколько изменить количество}.
+    Недостающие позиции вставляются с нулевым количеством и
+    ignore_conflicts, а количество меняется одним UPDATE через F(), поэтому
+    параллельные изменения одного списка не теряются и не падают на
+    unique_shopping_list_item.
+    '''
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    user_ids = set(user_ids)
+    if not user_ids or not deltas:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items() if delta > 0
+        ),
+        ignore_conflicts=True,
+    )
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    items.update(total_amount=Greatest(
+        F('total_amount') + Case(
+            *(When(ingredient_id=ingredient_id, then=Value(delta))
+              for ingredient_id, delta in deltas.items()),
+            output_field=IntegerField(),
+        ),
+        0,
+    ))
+    if any(delta < 0 for delta in deltas.values()):
+        items.filter(total_amount=0).delete()
+
+
+def add_to_shopping_list(user_id, recipe_ids):
+    change_shopping_lists([user_id], get_recipe_amounts(recipe_ids))
+
+
+def remove_from_shopping_list(user_id, recipe_ids):
+    amounts = get_recipe_amounts(recipe_ids)
+    change_shopping_lists(
+        [user_id],
+        {ingredient_id: -amount for ingredient_id, amount in amounts.items()},
+    )
+
+
+def remove_recipe_from_shopping_lists(recipe_id, user_ids):
+    '''Вычитает рецепт из списков покупок всех переданных пользователей.'''
+    amounts = get_recipe_amounts([recipe_id])
+    change_shopping_lists(
+        user_ids,
+        {ingredient_id: -amount for ingredient_id, amount in amounts.items()},
+    )
+
+
+def update_recipe_in_shopping_lists(recipe_id, old_amounts, new_amounts):
+    '''Переносит правку ингредиентов рецепта в списки покупок.'''
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    if not any(deltas.values()):
+        return
+    user_ids = ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True)
+    change_shopping_lists(user_ids, deltas)
+
+
+def _expected_shopping_lists(user_ids):
+    rows = (
+        IngredientRecipe.objects
+        .filter(recipe__added_to_cart__user_id__in=user_ids)
+        .values_list('recipe__added_to_cart__user_id', 'ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    return {(user_id, ingredient_id): total
+            for user_id, ingredient_id, total in rows}
+
+
+def rebuild_shopping_lists(dry_run=False):
+    '''Сверяет списки покупок с корзинами и исправляет расхождения.
+
+    Возвращает количество созданных, исправленных и удалённых позиций.
+    '''
+    created = updated = deleted = 0
+    user_ids = sorted(set(
+        ShoppingListItem.objects.values_list('user_id', flat=True)
+    ).union(ShoppingCart.objects.values_list('user_id', flat=True)))
+    for start in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        batch = user_ids[start:start + REBUILD_BATCH_SIZE]
+        with transaction.atomic():
+            expected = _expected_shopping_lists(batch)
+            to_update, to_delete = [], []
+            for item in ShoppingListItem.objects.select_for_update().filter(
+                    user_id__in=batch):
+                total = expected.pop((item.user_id, item.ingredient_id), 0)
+                if not total:
+                    to_delete.append(item.pk)
+                elif total != item.total_amount:
+                    item.total_amount = total
+                    to_update.append(item)
+            to_create = [
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total,
+                )
+                for (user_id, ingredient_id), total in expected.items()
+            ]
+            created += len(to_create)
+            updated += len(to_update)
+            deleted += len(to_delete)
+            if dry_run:
+                continue
+            ShoppingListItem.objects.bulk_create(to_create)
+            ShoppingListItem.objects.bulk_update(to_update, ['total_amount'])
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+    return created, updated, deleted
@@ -0,0 +1,181 @@
+import threading
+
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Following, User
+from .cache import ingredients_cache, tags_cache
+from .counters import RECIPE_COUNTERS, change_counter
+from .feed import add_author_to_feed, fan_out_recipe, remove_author_from_feed
+from .images import (clear_renditions, has_actual_renditions,
+                     schedule_renditions)
+from .membership import invalidate_recipe_flags
+from .models import FavoriteRecipe, Ingredient, Recipe, ShoppingCart, Tag
+from .search import update_search_index
+from .services import (add_to_shopping_list, remove_from_shopping_list,
+                       remove_recipe_from_shopping_lists)
+
+# Рецепты и пользователи, удаление которых идёт в текущем потоке.
+# Django отправляет pre_delete каскадно удаляемых строк раньше, чем
+# pre_delete родителя, но все pre_delete - раньше любых post_delete.
+# Поэтому родитель обрабатывает свои отметки пачкой в pre_delete, а
+# построчные обработчики работают в post_delete и пропускают строки
+# удаляемых родителей.
+#
+# Запись действует только в транзакции, в которой сделана: при commit и
+# rollback, в том числе до точки сохранения, Django заменяет список
+# отложенных on_commit соединения. Если удаление упадёт между pre_delete
+# и post_delete, его запись не повлияет на следующие удаления.
+_deleting = threading.local()
+
+
+def _deleting_registry(name):
+    registry = getattr(_deleting, name, None)
+    if registry is None:
+        registry = {}
+        setattr(_deleting, name, registry)
+    return registry
+
+
+def _mark_deleting(name, pk, using):
+    registry = _deleting_registry(name)
+    current = connections[using].run_on_commit
+    for stale in [key for key, transaction_hooks in registry.items()
+                  if transaction_hooks is not current]:
+        del registry[stale]
+    registry[pk] = current
+
+
+def _is_deleting(name, pk, using):
+    return (_deleting_registry(name).get(pk)
+            is connections[using].run_on_commit)
+
+
+def _parent_deleted(instance, using):
+    return (_is_deleting('recipes', instance.recipe_id, using)
+            or _is_deleting('users', instance.user_id, using))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_added(sender, instance, created, **kwargs):
+    if created:
+        add_to_shopping_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_item_removed(sender, instance, using, **kwargs):
+    if not _parent_deleted(instance, using):
+        remove_from_shopping_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    tags_cache.bump_version()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    ingredients_cache.bump_version()
+
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    '''Данные автора входят в кэшированное представление его рецептов.'''
+    if created or (update_fields and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    Recipe.objects.filter(author_id=instance.pk).update(
+        updated=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, 'recipes_count', [instance.author_id], 1)
+        fan_out_recipe(instance)
+    update_search_index(instance)
+    if not has_actual_renditions(instance):
+        clear_renditions(instance)
+        if instance.image:
+            schedule_renditions(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def recipe_flags_changed(sender, instance, using, **kwargs):
+    if not _parent_deleted(instance, using):
+        invalidate_recipe_flags(instance.user_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, using, **kwargs):
+    '''Убирает рецепт из списков покупок и сбрасывает флаги всех
+    отметивших его пользователей; счётчики рецепта не нужны.'''
+    _mark_deleting('recipes', instance.pk, using)
+    cart_users = set(ShoppingCart.objects.filter(
+        recipe=instance).values_list('user_id', flat=True))
+    remove_recipe_from_shopping_lists(instance.pk, cart_users)
+    favorite_users = set(FavoriteRecipe.objects.filter(
+        recipe=instance).values_list('user_id', flat=True))
+    for user_id in cart_users | favorite_users:
+        invalidate_recipe_flags(user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, using, **kwargs):
+    _deleting_registry('recipes').pop(instance.pk, None)
+    if not _is_deleting('users', instance.author_id, using):
+        change_counter(User, 'recipes_count', [instance.author_id], -1)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, using, **kwargs):
+    '''Уменьшает счётчики рецептов и авторов, отмеченных пользователем,
+    одним запросом на счётчик.'''
+    _mark_deleting('users', instance.pk, using)
+    for model, field in RECIPE_COUNTERS.items():
+        change_counter(Recipe, field, model.objects.filter(
+            user=instance).values('recipe_id'), -1)
+    change_counter(User, 'followers_count', Following.objects.filter(
+        follower=instance).values('to_follow_id'), -1)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    _deleting_registry('users').pop(instance.pk, None)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_marked(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe, RECIPE_COUNTERS[sender], [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_unmarked(sender, instance, using, **kwargs):
+    if not _parent_deleted(instance, using):
+        change_counter(
+            Recipe, RECIPE_COUNTERS[sender], [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Following)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, 'followers_count', [instance.to_follow_id], 1)
+        add_author_to_feed(instance.follower_id, instance.to_follow_id)
+
+
+@receiver(post_delete, sender=Following)
+def follow_deleted(sender, instance, using, **kwargs):
+    if (_is_deleting('users', instance.follower_id, using)
+            or _is_deleting('users', instance.to_follow_id, using)):
+        return
+    change_counter(User, 'followers_count', [instance.to_follow_id], -1)
+    remove_author_from_feed(instance.follower_id, instance.to_follow_id)
@@ -0,0 +1,264 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from users.models import Following, User
+
+from .counters import reconcile_counters
+from .feed import pull_feed
+from .membership import (RecipeFlags, _cache_key, get_recipe_flags,
+                         invalidate_recipe_flags)
+from .models import (FavoriteRecipe, FeedItem, Ingredient, IngredientRecipe,
+                     Recipe, ShoppingCart, ShoppingListItem)
+from .services import rebuild_shopping_lists
+from .transfer import RecipeImporter
+
+
+class RecipeFlagsCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', author=cls.user, text='Текст', cooking_time=5,
+            image='recipes/test.png')
+
+    def setUp(self):
+        cache.clear()
+
+    def get_flags(self):
+        return get_recipe_flags(SimpleNamespace(user=self.user))
+
+    def test_stale_fill_is_not_served(self):
+        # Запрос прочитал ключ и флаги до того, как отметка зафиксирована,
+        # а записал их в кэш уже после сброса.
+        key = _cache_key(self.user.pk)
+        stale = RecipeFlags.load(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        cache.set(key, stale)
+        self.assertTrue(self.get_flags().is_favorited(self.recipe.pk))
+
+    def test_invalidate_after_commit(self):
+        self.assertFalse(self.get_flags().is_favorited(self.recipe.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        self.assertTrue(self.get_flags().is_favorited(self.recipe.pk))
+
+    def test_lost_generation_does_not_reuse_keys(self):
+        key = _cache_key(self.user.pk)
+        cache.delete(f'recipe_flags_generation:{self.user.pk}')
+        self.assertNotEqual(_cache_key(self.user.pk), key)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_recipe_flags(self.user.pk)
+        self.assertNotEqual(_cache_key(self.user.pk), key)
+
+
+class CascadeDeleteTest(TestCase):
+    '''Удаление рецепта или пользователя не должно делать запросов на
+    каждую отметку.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+
+    def create_user(self, name):
+        return User.objects.create_user(
+            username=name, email=f'{name}@example.com', password='pass')
+
+    def create_recipe(self, author, name):
+        recipe = Recipe.objects.create(
+            name=name, author=author, text='Текст', cooking_time=5,
+            image='recipes/test.png')
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=10)
+            for ingredient in self.ingredients
+        )
+        return recipe
+
+    def create_marked(self, prefix, marks):
+        '''Автор, два его рецепта и marks пользователей, отметивших оба
+        рецепта и подписанных на автора; у отметивших есть и другой
+        рецепт в корзине.'''
+        author = self.create_user(f'{prefix}author')
+        recipes = [self.create_recipe(author, f'{prefix} рецепт {i}')
+                   for i in range(2)]
+        other = self.create_recipe(self.create_user(f'{prefix}other'),
+                                   f'{prefix} другой рецепт')
+        for i in range(marks):
+            user = self.create_user(f'{prefix}user{i}')
+            Following.objects.create(follower=user, to_follow=author)
+            for recipe in recipes:
+                FavoriteRecipe.objects.create(user=user, recipe=recipe)
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=other)
+        FavoriteRecipe.objects.create(user=author, recipe=other)
+        ShoppingCart.objects.create(user=author, recipe=other)
+        return author, recipes[0]
+
+    def count_queries(self, delete):
+        with CaptureQueriesContext(connection) as context:
+            delete()
+        return len(context)
+
+    def assert_consistent(self):
+        self.assertFalse(any(reconcile_counters(dry_run=True).values()))
+        self.assertEqual(rebuild_shopping_lists(dry_run=True), (0, 0, 0))
+
+    def test_recipe_delete(self):
+        _, few = self.create_marked('a', 2)
+        _, many = self.create_marked('b', 12)
+        self.assertEqual(self.count_queries(few.delete),
+                         self.count_queries(many.delete))
+        self.assert_consistent()
+        self.assertEqual(
+            ShoppingListItem.objects.filter(user__username='buser0').values(
+                'total_amount').distinct().get()['total_amount'], 20)
+
+    def test_user_delete(self):
+        few, _ = self.create_marked('a', 2)
+        many, _ = self.create_marked('b', 12)
+        self.assertEqual(self.count_queries(few.delete),
+                         self.count_queries(many.delete))
+        self.assert_consistent()
+
+    def test_failed_delete_does_not_leak(self):
+        author, recipe = self.create_marked('a', 2)
+
+        def fail(**kwargs):
+            raise RuntimeError
+
+        post_delete.connect(fail, sender=FavoriteRecipe)
+        try:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                recipe.delete()
+        finally:
+            post_delete.disconnect(fail, sender=FavoriteRecipe)
+        FavoriteRecipe.objects.filter(recipe=recipe).first().delete()
+        ShoppingCart.objects.filter(recipe=recipe).first().delete()
+        other = Recipe.objects.filter(author=author).exclude(pk=recipe.pk)
+        other.get().delete()
+        self.assert_consistent()
+
+
+class RecipeRenditionsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(
+            MEDIA_ROOT=cls.media_root, IMAGE_PIPELINE_BACKEND='sync')
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def make_image(self, name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), '#c0ffee').save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name=name)
+
+    def save(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        recipe.refresh_from_db()
+
+    def test_renditions_follow_image(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        recipe = Recipe(name='Рецепт', author=author, text='Текст',
+                        cooking_time=5, image=self.make_image('first.png'))
+        self.save(recipe)
+        old = recipe.image_thumbnail
+        self.assertTrue(old.name.startswith('recipes/renditions/first_'))
+        self.assertTrue(old.storage.exists(old.name))
+
+        recipe.image = self.make_image('second.png')
+        self.save(recipe)
+        self.assertFalse(old.storage.exists(old.name))
+        self.assertTrue(recipe.image_thumbnail.name.startswith(
+            'recipes/renditions/second_'))
+
+        new = recipe.image_thumbnail
+        recipe.image = ''
+        self.save(recipe)
+        self.assertFalse(new.storage.exists(new.name))
+        self.assertFalse(recipe.image_thumbnail)
+        self.assertFalse(recipe.image_feed)
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=0, FEED_BACKFILL_SIZE=2)
+class PullFeedTest(TestCase):
+
+    def test_pull_catches_up(self):
+        reader, author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass')
+            for name in ('reader', 'author'))
+        recipes = [Recipe.objects.create(
+            name='Рецепт 0', author=author, text='Текст', cooking_time=5,
+            image='recipes/test.png')]
+        Following.objects.create(follower=reader, to_follow=author)
+        author.refresh_from_db()
+        recipes += [
+            Recipe.objects.create(
+                name=f'Рецепт {i}', author=author, text='Текст',
+                cooking_time=5, image='recipes/test.png')
+            for i in range(1, 6)
+        ]
+        pull_feed(reader)
+        self.assertEqual(
+            set(FeedItem.objects.filter(user=reader).values_list(
+                'recipe_id', flat=True)),
+            {recipe.pk for recipe in recipes})
+
+
+class RecipeImporterTest(TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        os.makedirs(os.path.join(self.source, 'recipes'))
+        with open(os.path.join(self.source, 'recipes', 'a.png'), 'wb') as file:
+            file.write(b'image')
+        User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+
+    def test_rolled_back_batch_leaves_no_files(self):
+        record = {'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5,
+                  'author': 'author@example.com', 'image': 'recipes/a.png',
+                  'tags': [], 'ingredients': []}
+        importer = RecipeImporter(media_root=self.source)
+        with mock.patch.object(RecipeImporter, 'create_recipes',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                importer.run([json.dumps(record)])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'recipes')),
+                         [])
+        self.assertFalse(Recipe.objects.exists())
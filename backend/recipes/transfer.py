@@ -0,0 +1,211 @@
+import json
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+
+from users.models import User
+
+from .counters import change_counter
+from .models import Ingredient, IngredientRecipe, Recipe, Tag
+from .search import index_recipes
+from .utils import RecipeTag, batched, fetch_created_recipes
+
+
+def serialize_recipe(recipe):
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'author': recipe.author.email,
+        'image': recipe.image.name,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredientrecipe_set.all()
+        ],
+    }
+
+
+def export_recipes(file, batch_size=500):
+    '''Пишет рецепты в file в формате JSON lines; возвращает их число.
+
+    Рецепты читаются пачками по pk, для каждой пачки связи загружаются
+    отдельными запросами.
+    '''
+    exported = 0
+    pks = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+    for batch in batched(pks.iterator(), batch_size):
+        recipes = (
+            Recipe.objects
+            .filter(pk__in=batch)
+            .order_by('pk')
+            .select_related('author')
+            .prefetch_related(
+                'tags',
+                Prefetch('ingredientrecipe_set',
+                         queryset=IngredientRecipe.objects.select_related(
+                             'ingredient')),
+            )
+        )
+        for recipe in recipes:
+            file.write(json.dumps(serialize_recipe(recipe),
+                                  ensure_ascii=False))
+            file.write('\n')
+            exported += 1
+    return exported
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    existing: int = 0
+    errors: list = field(default_factory=list)
+
+
+class RecipeImporter:
+    '''Загружает рецепты из JSON lines пачками.
+
+    Авторы, теги и ингредиенты ищутся одним запросом на пачку, рецепты и
+    их связи создаются через bulk_create в одной транзакции на пачку.
+    Изображения копируются из media_root в хранилище пулом потоков.
+    '''
+
+    def __init__(self, media_root=None, batch_size=500, workers=4):
+        self.media_root = media_root
+        self.batch_size = batch_size
+        self.workers = workers
+        self.result = ImportResult()
+
+    def run(self, file):
+        records = (
+            (number, json.loads(line))
+            for number, line in enumerate(file, start=1) if line.strip()
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.executor = executor
+            for batch in batched(records, self.batch_size):
+                self.import_batch(batch)
+        return self.result
+
+    def resolve(self, records):
+        authors = User.objects.in_bulk(
+            {record['author'] for _, record in records}, field_name='email')
+        tags = Tag.objects.in_bulk(
+            {slug for _, record in records for slug in record['tags']},
+            field_name='slug')
+        ingredients = Ingredient.objects.in_bulk(
+            {item['name'] for _, record in records
+             for item in record['ingredients']},
+            field_name='name')
+        existing = set(Recipe.objects.filter(
+            name__in=[record['name'] for _, record in records],
+        ).values_list('name', flat=True))
+        return authors, tags, ingredients, existing
+
+    def check(self, number, record, authors, tags, ingredients):
+        missing = (
+            [record['author']] if record['author'] not in authors else []
+        ) + [slug for slug in record['tags'] if slug not in tags] + [
+            item['name'] for item in record['ingredients']
+            if item['name'] not in ingredients
+        ]
+        if missing:
+            self.result.errors.append(
+                f'Строка {number}: не найдены {", ".join(missing)}')
+        return not missing
+
+    def copy_image(self, name):
+        '''Копирует файл в хранилище; возвращает новое имя или ошибку.'''
+        if not name or not self.media_root:
+            return name, None
+        try:
+            with open(os.path.join(self.media_root, name), 'rb') as source:
+                return default_storage.save(name, File(source)), None
+        except OSError as error:
+            return None, error
+
+    def import_batch(self, batch):
+        authors, tags, ingredients, existing = self.resolve(batch)
+        records = []
+        for number, record in batch:
+            if record['name'] in existing:
+                self.result.existing += 1
+            elif self.check(number, record, authors, tags, ingredients):
+                records.append(record)
+                existing.add(record['name'])
+        if not records:
+            return
+        # Файлы копируются внутри транзакции пачки и удаляются, если она
+        # откатится, чтобы повторный запуск не плодил копии.
+        images = []
+        try:
+            with transaction.atomic():
+                ready = self.copy_images(records, images)
+                if ready:
+                    self.create_recipes(
+                        ready, images, authors, tags, ingredients)
+        except Exception:
+            self.delete_images(images)
+            raise
+        self.result.imported += len(ready)
+
+    def copy_images(self, records, images):
+        '''Копирует изображения пулом потоков; имена копий дописывает в
+        images. Возвращает записи, изображения которых скопированы.'''
+        copied = self.executor.map(
+            self.copy_image, [record.get('image') for record in records])
+        ready = []
+        for record, (image, error) in zip(records, copied):
+            if error is not None:
+                self.result.errors.append(
+                    f'{record["name"]}: изображение не скопировано: {error}')
+                continue
+            ready.append(record)
+            images.append(image)
+        return ready
+
+    def delete_images(self, images):
+        for image in images:
+            if image and self.media_root:
+                default_storage.delete(image)
+
+    def create_recipes(self, records, images, authors, tags, ingredients):
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                author=authors[record['author']],
+                image=image or '',
+            )
+            for record, image in zip(records, images)
+        )
+        recipes = fetch_created_recipes(
+            [record['name'] for record in records])
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe_id=recipes[record['name']].pk,
+                      tag_id=tags[slug].pk)
+            for record in records for slug in set(record['tags'])
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe_id=recipes[record['name']].pk,
+                ingredient_id=ingredients[item['name']].pk,
+                amount=item['amount'],
+            )
+            for record in records for item in record['ingredients']
+        )
+        index_recipes(recipes.values())
+        per_author = Counter(record['author'] for record in records)
+        for email, count in per_author.items():
+            change_counter(User, 'recipes_count', [authors[email].pk], count)
@@ -0,0 +1,57 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .cache import trending_cache
+from .models import FavoriteRecipe, RecipeTrendingScore, ShoppingCart
+
+ACTIVITY_MODELS = {
+    'favorite': FavoriteRecipe,
+    'shopping_cart': ShoppingCart,
+}
+
+
+def get_trending_scores(now=None):
+    '''Рейтинг рецептов по активности за последние TRENDING_WINDOW_DAYS.
+
+    Каждое добавление в избранное или корзину весит TRENDING_WEIGHTS и
+    вдвое теряет вес каждые TRENDING_HALF_LIFE_HOURS. Активность
+    группируется по часам, чтобы не читать каждую строку.
+    '''
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+    scores = defaultdict(float)
+    for kind, model in ACTIVITY_MODELS.items():
+        weight = settings.TRENDING_WEIGHTS[kind]
+        rows = (
+            model.objects
+            .filter(created__gte=since)
+            .annotate(hour=TruncHour('created'))
+            .values_list('recipe_id', 'hour')
+            .annotate(total=Count('pk'))
+            .order_by()
+        )
+        for recipe_id, hour, total in rows.iterator():
+            age = max(now - hour, timedelta())
+            scores[recipe_id] += weight * total * 0.5 ** (age / half_life)
+    return scores
+
+
+def compute_trending_scores(now=None):
+    '''Заменяет содержимое таблицы рейтингов; возвращает число строк.'''
+    scores = get_trending_scores(now)
+    with transaction.atomic():
+        RecipeTrendingScore.objects.all().delete()
+        RecipeTrendingScore.objects.bulk_create(
+            (RecipeTrendingScore(recipe_id=recipe_id, score=score)
+             for recipe_id, score in scores.items()),
+            batch_size=1000,
+        )
+    trending_cache.bump_version()
+    return len(scores)
@@ -0,0 +1,23 @@
+from itertools import islice
+
+from .models import Recipe
+
+RecipeTag = Recipe.tags.through
+
+
+def batched(iterable, size):
+    '''Разбивает iterable на списки длиной не больше size.'''
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def fetch_created_recipes(names):
+    '''Рецепты, только что созданные через bulk_create, по названиям.
+
+    Не все СУБД возвращают pk из bulk_create, поэтому рецепты читаются
+    заново по уникальному названию.
+    '''
+    return Recipe.objects.in_bulk(names, field_name='name')
@@ -11,6 +11,8 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'email',
+        'recipes_count',
+        'followers_count',
     )
     list_filter = ('email', 'username',)
     search_fields = ('email', 'username',)